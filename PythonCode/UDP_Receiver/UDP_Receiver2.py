@@ -14,9 +14,10 @@ import panda3d
 from draw_sphere import draw_sphere
 from direct.filter.FilterManager import FilterManager
 
-import json
 import keyboard
 
+from frame_recorder import FrameRecorder, load_last_frame, run_log_path, save_frame
+
 from matplotlib import cm
 from matplotlib.colors import ListedColormap, LinearSegmentedColormap
 colormap = cm.get_cmap('viridis', 1000)
@@ -358,6 +359,14 @@ bufferSize = 60000
 
 bytesToSend = b'17'# str.encode(msgFromServer)
 
+# received frames are logged by a background writer (see frame_recorder.py), every run to its own
+# <recordPath stem>_<date-time>.svmlog, None disables recording
+recordPath = None
+# the last received frame, replayed after a timeout. It is saved to lastFramePath on exit and restored at the next
+# start, so a timeout before the first frame replays the previous run's last frame (prevFrame.bin before).
+lastFramePath = "prevFrame.svmlog"
+lastFrame = None
+
 
 color_map = [(50, 50, 50),
              (130, 120, 110),
@@ -699,7 +708,9 @@ def ProcSvmFromPackets(base, fullPackets, packetNum,
         
     cv.waitKey(1)
     
-def ReceiveData(UDPServerSocket):
+def ReceiveData(UDPServerSocket, recorder=None):
+    global lastFrame
+    frameCount = 0
     # Listen for incoming datagrams
     while(True):
 
@@ -752,22 +763,10 @@ def ReceiveData(UDPServerSocket):
                     #print(("index {i}, num bytes {b}").format(i=index, b=len(packet)))
                 
                 # now one frame's full packet is completed
-                data = {
-                    "packetNum" : packetNum,
-                    "bytesPoints" : bytesPoints,
-                    "bytesDepthmap" : bytesDepthmap,
-                    "bytesRGBmap" : bytesRGBmap,
-                    "numLidars" : numLidars,
-                    "lidarRes" : lidarRes,
-                    "lidarChs" : lidarChs,
-                    "imageWidth" : imageWidth,
-                    "imageHeight" : imageHeight
-                }
-                with open("params.json", "w") as json_file:
-                    json.dump(data, json_file, indent=4)
-                
-                with open('prevFrame.bin', 'wb') as f:
-                    f.write(fullPackets)
+                lastFrame = (packetInit, fullPackets)
+                if recorder is not None:
+                    recorder.record(frameCount, packetInit, fullPackets)
+                frameCount += 1
                 
                 print(("Bytes of All Packets: {d}").format(d=len(fullPackets)))
                 # to do 
@@ -778,21 +777,21 @@ def ReceiveData(UDPServerSocket):
             
         except socket.timeout:
             print("No data received after {} seconds. Timed out.".format(timeout))
-            with open("params.json", "r") as json_file:
-                restored_data = json.load(json_file)
-
-            packetNum = restored_data["packetNum"]
-            bytesPoints = restored_data["bytesPoints"]
-            bytesDepthmap = restored_data["bytesDepthmap"]
-            bytesRGBmap = restored_data["bytesRGBmap"]
-            numLidars = restored_data["numLidars"]
-            lidarRes = restored_data["lidarRes"]
-            lidarChs = restored_data["lidarChs"]
-            imageWidth = restored_data["imageWidth"]
-            imageHeight = restored_data["imageHeight"]
+            if lastFrame is None:
+                continue
+            restoredInit, restoredFrame = lastFrame
+
+            packetNum = int.from_bytes(restoredInit[4:8], "little")
+            bytesPoints = int.from_bytes(restoredInit[8:12], "little")
+            bytesDepthmap = int.from_bytes(restoredInit[12:16], "little")
+            bytesRGBmap = int.from_bytes(restoredInit[16:20], "little")
+            numLidars = int.from_bytes(restoredInit[20:24], "little")
+            lidarRes = int.from_bytes(restoredInit[24:28], "little")
+            lidarChs = int.from_bytes(restoredInit[28:32], "little")
+            imageWidth = int.from_bytes(restoredInit[32:36], "little")
+            imageHeight = int.from_bytes(restoredInit[36:40], "little")
             
-            with open('prevFrame.bin', 'rb') as f:
-                fullPackets = bytearray(f.read())
+            fullPackets = bytearray(restoredFrame)
                 
             print(("Bytes of All Packets: {d}").format(d=len(fullPackets)))
                 
@@ -893,8 +892,19 @@ if __name__ == "__main__":
 
     mySvm.isInitializedUDP = True
 
-    t = threading.Thread(target=ReceiveData, args=(UDPServerSocket))
+    lastFrame = load_last_frame(lastFramePath)
+    recorder = None
+    if recordPath is not None:
+        recorder = FrameRecorder(run_log_path(recordPath))
+
+    t = threading.Thread(target=ReceiveData, args=(UDPServerSocket, recorder))
     t.start()
 
     print("SVM Start!")
-    mySvm.run()
+    try:
+        mySvm.run()
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if lastFrame is not None:
+            save_frame(lastFramePath, *lastFrame)
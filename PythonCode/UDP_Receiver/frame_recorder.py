@@ -0,0 +1,145 @@
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+# Frame log of reassembled UDP frames.
+# <path>      : records of [recordHeader][init packet bytes][frame bytes], appended in chunks
+# <path>.idx  : one uint64 record offset per frame, fixed stride so frame k is found in O(1)
+# The init packet is stored with every frame so any record can be replayed on its own.
+# A log holds one run (frame numbers restart with every run), run_log_path() gives every run its own file.
+
+recordMagic = b"FRM0"
+recordFormat = "<4sIdII"  # magic, wire frame number, timestamp, init bytes, frame bytes
+recordSize = struct.calcsize(recordFormat)
+
+
+class FrameRecorder:
+    # Appends frames from a background writer thread so the receive loop never waits on disk.
+    # At most maxPending frames are buffered, further frames are dropped (and counted) until the writer catches up.
+    def __init__(self, path, maxPending=8, chunkBytes=8 << 20):
+        self.path = path
+        self.maxPending = maxPending
+        self.chunkBytes = chunkBytes
+        self.pending = queue.Queue(maxsize=maxPending)
+        self.lastFrame = None
+
+        self.recorded = 0
+        self.dropped = 0
+        self.bytesWritten = 0
+
+        self.dataFile = open(path, "wb")
+        self.indexFile = open(path + ".idx", "wb")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def record(self, frame, initPacket, payload):
+        # called from the receive loop, never blocks
+        self.lastFrame = (frame, bytes(initPacket), payload)
+        try:
+            self.pending.put_nowait((frame, time.time(), bytes(initPacket), bytes(payload)))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            chunk = [item]
+            chunkBytes = len(item[3])
+            # batch whatever is already queued into one write
+            while chunkBytes < self.chunkBytes:
+                try:
+                    item = self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(chunk)
+                    return
+                chunk.append(item)
+                chunkBytes += len(item[3])
+            self._write(chunk)
+
+    def _write(self, chunk):
+        offset = self.dataFile.tell()
+        offsets = []
+        for frame, stamp, initPacket, payload in chunk:
+            offsets.append(offset)
+            header = struct.pack(recordFormat, recordMagic, frame, stamp, len(initPacket), len(payload))
+            self.dataFile.write(header)
+            self.dataFile.write(initPacket)
+            self.dataFile.write(payload)
+            offset += recordSize + len(initPacket) + len(payload)
+        self.dataFile.flush()
+        # the index is written after the data so a readable index entry always points at a complete record
+        self.indexFile.write(np.array(offsets, dtype=np.uint64).tobytes())
+        self.indexFile.flush()
+        self.recorded += len(chunk)
+        self.bytesWritten = offset
+
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+        self.dataFile.close()
+        self.indexFile.close()
+
+
+class FrameLog:
+    # random access reader, read(k) returns (frame, timestamp, initPacket, payload)
+    def __init__(self, path):
+        self.path = path
+        self.offsets = np.fromfile(path + ".idx", dtype=np.uint64)
+        self.dataFile = open(path, "rb")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def read(self, k):
+        self.dataFile.seek(int(self.offsets[k]))
+        magic, frame, stamp, initBytes, frameBytes = struct.unpack(recordFormat, self.dataFile.read(recordSize))
+        if magic != recordMagic:
+            raise IOError("Corrupted record {} in {}".format(k, self.path))
+        initPacket = self.dataFile.read(initBytes)
+        payload = self.dataFile.read(frameBytes)
+        return frame, stamp, initPacket, payload
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self.read(k)
+
+    def close(self):
+        self.dataFile.close()
+
+
+def has_log(path):
+    return os.path.exists(path) and os.path.exists(path + ".idx")
+
+
+def run_log_path(path):
+    # frames.svmlog -> frames_<yyyymmdd-hhmmss>.svmlog
+    root, ext = os.path.splitext(path)
+    return "{}_{}{}".format(root, time.strftime("%Y%m%d-%H%M%S"), ext)
+
+
+def save_frame(path, initPacket, payload, frame=0):
+    # single frame log, e.g. the last frame of a run
+    recorder = FrameRecorder(path)
+    recorder.record(frame, initPacket, payload)
+    recorder.close()
+
+
+def load_last_frame(path):
+    # -> (initPacket, payload) of the last frame of a log, None without one
+    if not has_log(path):
+        return None
+    log = FrameLog(path)
+    try:
+        if len(log) == 0:
+            return None
+        return log.read(len(log) - 1)[2:]
+    finally:
+        log.close()
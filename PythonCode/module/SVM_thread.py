@@ -1,3 +1,4 @@
+import argparse
 import math
 import queue
 import threading
@@ -12,33 +13,83 @@ from panda3d.core import Shader
 from scipy.sparse import lil_matrix
 from scipy.sparse.linalg import spsolve
 
+import frame_trace
+import instrumentation
+import label_source
 import UDP_ReceiverSingle
+import undistort_stage
 
 # from draw_sphere import draw_sphere
 
 winSizeX = 1024
 winSizeY = 1024
 
+# source of the semantic labels uploaded to semanticTexArray (see label_source.py)
+# "groundTruth" : semantic images from Unreal
+# "model" : PIDNet in the render loop
+# "modelAsync" : PIDNet in a background process, the latest available labels are uploaded
+labelSourceName = "groundTruth"
+
+# "udp" : frames from Unreal (UDP_ReceiverSingle), "synthetic" : generated frames fed straight into the queue
+frameSourceName = "udp"
+
+# reassembled frames are logged for offline replay (see frame_recorder.py), every run to its own
+# <recordPath stem>_<date-time>.svmlog, None disables recording
+recordPath = None
+
+# named timers and counters of the hot paths (see instrumentation.py), dumped with the "t" key
+# and appended to instrumentationLog every instrumentationInterval seconds when set
+instrumentationEnabled = False
+instrumentationLog = None
+instrumentationInterval = 10.0
+
+# per-frame latency trace from the first datagram to the texture upload (see frame_trace.py),
+# the "x" key prints the span latencies and writes tracePath (Chrome trace-event JSON)
+traceEnabled = False
+tracePath = "frame_trace.json"
+
+# headless mode renders into an offscreen buffer (no display needed) for headlessFrames frames and writes the
+# composited top-down frames to headlessOutput : None, "png" (headlessOutputPath directory) or "shm" (shared memory
+# ring named headlessOutputPath, see headless_output.py), render and readback times are dumped at the end
+headless = False
+headlessDisplay = "p3headlessgl"  # "p3tinydisplay" for a software renderer without GLSL
+headlessFrames = 100
+headlessOutput = None
+headlessOutputPath = "headless_frames"
+# "gpu" : the shader passes above, "cpu" : the camera images are stitched with the precomputed remap tables of
+# birdseye_remap.py (cached in birdseye_remap.cacheDir), no rendering, without the semantic height correction and
+# the lidar points
+headlessStitch = "gpu"
+
+# fisheye streams (init packet isFisheye) are undistorted on the CPU before the upload, with the intrinsics of
+# undistortCalibration (see undistort_stage.py), the "u" key prints the ms per frame of every camera
+undistortCalibration = undistort_stage.calibrationPath
+undistortThreads = 4
+
 
 class SurroundView(ShowBase):
     def __init__(self):
         super().__init__()
         winprops = p3d.WindowProperties()
         winprops.setSize(winSizeX, winSizeX)
-        self.win.requestProperties(winprops)
+        # headless : self.win is an offscreen buffer sized by win-size
+        if isinstance(self.win, p3d.GraphicsWindow):
+            self.win.requestProperties(winprops)
 
         self.render.setAntialias(p3d.AntialiasAttrib.MAuto)
         self.cam.setPos(0, 0, 3000)
         self.cam.lookAt(p3d.LPoint3f(0, 0, 0), p3d.LVector3f(0, 1, 0))
         self.camLens.setFov(60)
 
-        mat = p3d.Mat4(self.cam.getMat())
-        mat.invertInPlace()
-        self.mouseInterfaceNode.setMat(mat)
-        self.enableMouse()
+        # headless has no mouse, the camera keeps the top-down pose
+        if isinstance(self.win, p3d.GraphicsWindow):
+            mat = p3d.Mat4(self.cam.getMat())
+            mat.invertInPlace()
+            self.mouseInterfaceNode.setMat(mat)
+            self.enableMouse()
 
-        self.cam.setPos(0, 0, 0)
-        self.cam.setHpr(0, 0, 0)
+            self.cam.setPos(0, 0, 0)
+            self.cam.setHpr(0, 0, 0)
 
         self.renderObj = p3d.NodePath("fgRender")
         self.renderSVM = p3d.NodePath("bgRender")
@@ -154,6 +205,9 @@ class SurroundView(ShowBase):
         self.debug_mode = 0
 
         self.isPointCloudSetup = False
+        self.undistorter = None
+        # init packet fields of the last InitSVM
+        self.svmHeader = None
         self.lidarRes = 0
         self.lidarChs = 0
         self.numLidars = 0
@@ -298,7 +352,8 @@ class SurroundView(ShowBase):
         self.buffer1.set_active(True)
         self.buffer2.set_active(True)
         self.win.set_active(False)
-        self.graphics_engine.render_frame()
+        with instrumentation.timer("readTextureData.render"):
+            self.graphics_engine.render_frame()
 
         # Get the render target texture
         tex0 = self.buffer1.getTexture(0)
@@ -315,49 +370,8 @@ class SurroundView(ShowBase):
         self.interquad.setShaderInput("texGeoInfo0", tex0)
 
         # dynamic blending weight
-        mapProp = np.flip(array0[:, :, 2], 0)
-        overlapIndex0 = np.flip(array0[:, :, 1], 0)
-        overlapIndex1 = np.flip(array0[:, :, 0], 0)
-        count = np.flip(array0[:, :, 3], 0)
-
-        semantic = mapProp // 100
-        camId0 = mapProp % 100 // 10
-        camId1 = mapProp % 10
-        overlapIndex0 = np.where(count == 2, overlapIndex0, 255)
-        overlapIndex1 = np.where(count == 2, overlapIndex1, 255)
-
-        cam0 = np.where((overlapIndex0 == 0) | (overlapIndex1 == 0), 1, 0)
-        cam1 = np.where((overlapIndex0 == 1) | (overlapIndex1 == 1), 1, 0)
-        cam2 = np.where((overlapIndex0 == 2) | (overlapIndex1 == 2), 1, 0)
-        cam3 = np.where((overlapIndex0 == 3) | (overlapIndex1 == 3), 1, 0)
-
-        semantic01 = np.where(cam0 & cam1, semantic, 0)
-        semantic12 = np.where(cam1 & cam2, semantic, 0)
-        semantic23 = np.where(cam2 & cam3, semantic, 0)
-        semantic30 = np.where(cam3 & cam0, semantic, 0)
-
-        w = [0.5, 0.5, 0.5, 0.5]
-
-        overlap_semantics = [semantic01, semantic12, semantic23, semantic30]
-
-        # sets blending weights w based on the highest semantic value
-        for semantic_value in range(1, np.max(semantic) + 1):
-            for i, overlap_semantic in enumerate(overlap_semantics):
-                idx0 = i
-                idx1 = (i + 1) % 4
-
-                camId0_values = camId0[((camId0 == idx0) | (camId0 == idx1)) & (overlap_semantic == semantic_value)]
-                camId1_values = camId1[((camId1 == idx0) | (camId1 == idx1)) & (overlap_semantic == semantic_value)]
-
-                idx0_count = np.sum(camId0_values == idx0) + np.sum(camId1_values == idx0)
-                idx1_count = np.sum(camId0_values == idx1) + np.sum(camId1_values == idx1)
-
-                if idx0_count + idx1_count == 0:
-                    continue
-
-                w[i] = idx0_count / (idx0_count + idx1_count)
-
-        w = np.clip(w, 0.1, 0.9)
+        with instrumentation.timer("readTextureData.blendingWeights"):
+            w = ComputeBlendingWeights(array0)
 
         self.interquad.setShaderInput("w01", w[0])
         self.interquad.setShaderInput("w12", w[1])
@@ -373,11 +387,8 @@ class SurroundView(ShowBase):
             np_texture = np_texture.reshape((texInterResult.get_y_size(), texInterResult.get_x_size(), 4))
 
             # inpainting
-            array = np_texture.copy()
-            img = cv.cvtColor(array, cv.COLOR_BGRA2BGR)
-            mask = cv.inRange(img, (0, 0, 0), (0, 0, 0))
-            dst = cv.inpaint(img, mask, 3, cv.INPAINT_TELEA)
-            array = cv.cvtColor(dst, cv.COLOR_BGR2BGRA)
+            with instrumentation.timer("readTextureData.inpainting"):
+                array = InpaintHoles(np_texture)
 
             self.texInpaint.setup2dTexture(
                 texInterResult.get_x_size(),
@@ -396,23 +407,82 @@ class SurroundView(ShowBase):
         return task.cont
 
     def shaderRecompile(self):
-        self.planeShader = Shader.load(
-            Shader.SL_GLSL, vertex="./shaders/svm_vs.glsl", fragment="./shaders/svm_ps_plane.glsl"
-        )
-        self.plane.setShader(mySvm.planeShader)
-        # self.sphereShader = Shader.load(Shader.SL_GLSL, vertex="./shaders/sphere_vs.glsl", fragment="./shaders/sphere_ps.glsl")
-        # self.sphere.setShader(self.sphereShader)
+        instrumentation.count("shaderRecompile")
+        with instrumentation.timer("shaderRecompile"):
+            self.planeShader = Shader.load(
+                Shader.SL_GLSL, vertex="./shaders/svm_vs.glsl", fragment="./shaders/svm_ps_plane.glsl"
+            )
+            self.plane.setShader(mySvm.planeShader)
+            # self.sphereShader = Shader.load(Shader.SL_GLSL, vertex="./shaders/sphere_vs.glsl", fragment="./shaders/sphere_ps.glsl")
+            # self.sphere.setShader(self.sphereShader)
 
-        self.interquad.setShader(
-            Shader.load(Shader.SL_GLSL, vertex="./shaders/post1_vs.glsl", fragment="./shaders/svm_post1_ps.glsl")
-        )
-        self.finalquad.setShader(
-            Shader.load(Shader.SL_GLSL, vertex="./shaders/post1_vs.glsl", fragment="./shaders/final_composite_ps.glsl")
-        )
+            self.interquad.setShader(
+                Shader.load(Shader.SL_GLSL, vertex="./shaders/post1_vs.glsl", fragment="./shaders/svm_post1_ps.glsl")
+            )
+            self.finalquad.setShader(
+                Shader.load(
+                    Shader.SL_GLSL, vertex="./shaders/post1_vs.glsl", fragment="./shaders/final_composite_ps.glsl"
+                )
+            )
 
 
-def GeneratePointNode():
-    svmBase = mySvm
+def ComputeBlendingWeights(geoInfo):
+    # texGeoInfo0 read-back (H, W, 4) uint32 -> blending weights w01, w12, w23, w30
+    mapProp = np.flip(geoInfo[:, :, 2], 0)
+    overlapIndex0 = np.flip(geoInfo[:, :, 1], 0)
+    overlapIndex1 = np.flip(geoInfo[:, :, 0], 0)
+    count = np.flip(geoInfo[:, :, 3], 0)
+
+    semantic = mapProp // 100
+    camId0 = mapProp % 100 // 10
+    camId1 = mapProp % 10
+    overlapIndex0 = np.where(count == 2, overlapIndex0, 255)
+    overlapIndex1 = np.where(count == 2, overlapIndex1, 255)
+
+    cam0 = np.where((overlapIndex0 == 0) | (overlapIndex1 == 0), 1, 0)
+    cam1 = np.where((overlapIndex0 == 1) | (overlapIndex1 == 1), 1, 0)
+    cam2 = np.where((overlapIndex0 == 2) | (overlapIndex1 == 2), 1, 0)
+    cam3 = np.where((overlapIndex0 == 3) | (overlapIndex1 == 3), 1, 0)
+
+    semantic01 = np.where(cam0 & cam1, semantic, 0)
+    semantic12 = np.where(cam1 & cam2, semantic, 0)
+    semantic23 = np.where(cam2 & cam3, semantic, 0)
+    semantic30 = np.where(cam3 & cam0, semantic, 0)
+
+    w = [0.5, 0.5, 0.5, 0.5]
+
+    overlap_semantics = [semantic01, semantic12, semantic23, semantic30]
+
+    # sets blending weights w based on the highest semantic value
+    for semantic_value in range(1, np.max(semantic) + 1):
+        for i, overlap_semantic in enumerate(overlap_semantics):
+            idx0 = i
+            idx1 = (i + 1) % 4
+
+            camId0_values = camId0[((camId0 == idx0) | (camId0 == idx1)) & (overlap_semantic == semantic_value)]
+            camId1_values = camId1[((camId1 == idx0) | (camId1 == idx1)) & (overlap_semantic == semantic_value)]
+
+            idx0_count = np.sum(camId0_values == idx0) + np.sum(camId1_values == idx0)
+            idx1_count = np.sum(camId0_values == idx1) + np.sum(camId1_values == idx1)
+
+            if idx0_count + idx1_count == 0:
+                continue
+
+            w[i] = idx0_count / (idx0_count + idx1_count)
+
+    w = np.clip(w, 0.1, 0.9)
+    return w
+
+
+def InpaintHoles(image):
+    # fills the black (unseen) pixels of the BGRA composite
+    img = cv.cvtColor(image, cv.COLOR_BGRA2BGR)
+    mask = cv.inRange(img, (0, 0, 0), (0, 0, 0))
+    dst = cv.inpaint(img, mask, 3, cv.INPAINT_TELEA)
+    return cv.cvtColor(dst, cv.COLOR_BGR2BGRA)
+
+
+def GeneratePointNode(svmBase):
     # note: use Geom.UHDynamic instead of Geom.UHStatic (resource setting for immutable or dynamic)
     vdata = p3d.GeomVertexData("point_data", p3d.GeomVertexFormat.getV3c4(), p3d.Geom.UHDynamic)
     numMaxPoints = svmBase.lidarRes * svmBase.lidarChs * svmBase.numLidars
@@ -462,83 +532,71 @@ def GeneratePointNode():
 
 
 def UpdateResource(task):
-    PacketProcessing(mySvm.packetInit, mySvm.qQ)
+    with instrumentation.timer("PacketProcessing"):
+        PacketProcessing(mySvm.packetInit, mySvm.qQ)
     return task.cont
 
 
-def InitSVM(base, numLidars, lidarRes, lidarChs, imageWidth, imageHeight, imgs, worldpointlist):
-    if base.isInitializedUDP is True:
-        return
-
-    def createOglProjMatrix(fov, aspectRatio, n, f):
-        tanHalfFovy = math.tan(fov / 2.0 * np.deg2rad(1))
-        tanHalfFovx = tanHalfFovy * aspectRatio
-        # col major in pand3d core but memory convention is based on the conventional row major
-        # GLM_DEPTH_CLIP_SPACE == GLM_DEPTH_ZERO_TO_ONE version
-        projMat = p3d.LMatrix4f(
-            1.0 / tanHalfFovx,
-            0,
-            0,
-            0,
-            0,
-            1.0 / tanHalfFovy,
-            0,
-            0,
-            0,
-            0,
-            f / (n - f),
-            -f * n / (f - n),
-            0,
-            0,
-            -1,
-            0,
-        )
-        projMat.transpose_in_place()
-        return projMat
-
-    def computeLookAtLH(eye, center, up):
-        z = eye - center
-        z.normalize()
-        x = z.cross(up)
-        x.normalize()
-        y = x.cross(z)
-        # print(("x {}").format(x))
-        # print(("y {}").format(y))
-        # print(("z {}").format(z))
-        # row major in pand3d core but memory convention is based on the conventional column major
-        matLookAt = p3d.LMatrix4f(
-            x[0],
-            y[0],
-            z[0],
-            0.0,
-            x[1],
-            y[1],
-            z[1],
-            0.0,
-            x[2],
-            y[2],
-            z[2],
-            0.0,
-            -p3d.LVector3f.dot(x, eye),
-            -p3d.LVector3f.dot(y, eye),
-            -p3d.LVector3f.dot(z, eye),
-            1.0,
-        )
-        return matLookAt
-
-    base.isInitializedUDP = True
-
-    # print(("Num Lidars : {Num}").format(Num=numLidars))
-    # print(("Lidar Channels : {Num}").format(Num=lidarChs))
-    # print(("Camera Width : {Num}").format(Num=imageWidth))
-    # print(("Camera Height : {Num}").format(Num=imageHeight))
-
-    base.lidarRes = lidarRes
-    base.lidarChs = lidarChs
-    base.numLidars = numLidars
+def createOglProjMatrix(fov, aspectRatio, n, f):
+    tanHalfFovy = math.tan(fov / 2.0 * np.deg2rad(1))
+    tanHalfFovx = tanHalfFovy * aspectRatio
+    # col major in pand3d core but memory convention is based on the conventional row major
+    # GLM_DEPTH_CLIP_SPACE == GLM_DEPTH_ZERO_TO_ONE version
+    projMat = p3d.LMatrix4f(
+        1.0 / tanHalfFovx,
+        0,
+        0,
+        0,
+        0,
+        1.0 / tanHalfFovy,
+        0,
+        0,
+        0,
+        0,
+        f / (n - f),
+        -f * n / (f - n),
+        0,
+        0,
+        -1,
+        0,
+    )
+    projMat.transpose_in_place()
+    return projMat
+
+
+def computeLookAtLH(eye, center, up):
+    z = eye - center
+    z.normalize()
+    x = z.cross(up)
+    x.normalize()
+    y = x.cross(z)
+    # print(("x {}").format(x))
+    # print(("y {}").format(y))
+    # print(("z {}").format(z))
+    # row major in pand3d core but memory convention is based on the conventional column major
+    matLookAt = p3d.LMatrix4f(
+        x[0],
+        y[0],
+        z[0],
+        0.0,
+        x[1],
+        y[1],
+        z[1],
+        0.0,
+        x[2],
+        y[2],
+        z[2],
+        0.0,
+        -p3d.LVector3f.dot(x, eye),
+        -p3d.LVector3f.dot(y, eye),
+        -p3d.LVector3f.dot(z, eye),
+        1.0,
+    )
+    return matLookAt
 
-    GeneratePointNode()
 
+def ComputeViewProjs(packetInit: dict, imageWidth, imageHeight):
+    # camera poses of the init packet -> matViewProj0..3 (as passed to svm_ps_plane.glsl) and the sensor matrices
     camera_fov = packetInit["Fov"]
     verFoV = 2 * math.atan(math.tan(camera_fov * np.deg2rad(1) / 2) * (imageHeight / imageWidth)) * np.rad2deg(1)
     projMat = createOglProjMatrix(verFoV, imageWidth / imageHeight, 10, 100000)
@@ -564,12 +622,7 @@ def InitSVM(base, numLidars, lidarRes, lidarChs, imageWidth, imageHeight, imgs,
     sensorMatLHS_array = [p3d.LMatrix4f(), p3d.LMatrix4f(), p3d.LMatrix4f(), p3d.LMatrix4f()]
     imgIdx = 0
 
-    for sensorPos, camPos in zip(sensor_pos_array, base.camPositions):
-        camPos = sensorPos + cam_pos
-
-    base.plane.setShaderInput("camPositions", base.camPositions)
-
-    base.matViewProjs = [p3d.LMatrix4f(), p3d.LMatrix4f(), p3d.LMatrix4f(), p3d.LMatrix4f()]
+    matViewProjs = [p3d.LMatrix4f(), p3d.LMatrix4f(), p3d.LMatrix4f(), p3d.LMatrix4f()]
     for deg, pos, rot_y in zip(sensor_rot_z_array, sensor_pos_array, cam_rot_y_array):
         sensorMatRHS = p3d.LMatrix4f.rotateMat(deg, p3d.Vec3(0, 0, -1)) * p3d.LMatrix4f.translateMat(
             pos.x, -pos.y, pos.z
@@ -593,7 +646,7 @@ def InitSVM(base, numLidars, lidarRes, lidarChs, imageWidth, imageHeight, imgs,
         # viewProjMat = p3d.LMatrix4f()
         viewProjMat = viewMat * projMat
 
-        base.matViewProjs[imgIdx] = viewProjMat
+        matViewProjs[imgIdx] = viewProjMat
         # if imgIdx == 1:
         #     print(("camPos1 {}").format(camMat.xformPoint(p3d.Vec3(0, 0, 0))))
         #     print(("camPos2 {}").format(pos))
@@ -601,43 +654,107 @@ def InitSVM(base, numLidars, lidarRes, lidarChs, imageWidth, imageHeight, imgs,
         #     print(("camUp  {}").format(camMat.xform(p3d.Vec3(0, 0, 1))))
         #     print("############")
 
-        base.plane.setShaderInput("matViewProj" + str(imgIdx), viewProjMat)
-        # print("plane.setShaderInput")
-        base.interquad.setShaderInput("matViewProj" + str(imgIdx), viewProjMat)
-        # print("plane.setShaderInput")
-        # base.sphere.setShaderInput("matViewProj" + str(imgIdx), viewProjMat)
-        # print("plane.setShaderInput")
         imgIdx += 1
 
-    base.planeTexArray.setup2dTextureArray(imageWidth, imageHeight, 4, p3d.Texture.T_unsigned_byte, p3d.Texture.F_rgba)
-    base.plane.setShaderInput("cameraImgs", base.planeTexArray)
-    # base.sphere.setShaderInput("cameraImgs", base.planeTexArray)
+    return matViewProjs, sensorMatLHS_array
+
+
+# init packet fields InitSVM depends on, by the resources they rebuild when they change
+initViewFields = [
+    "imageWidth",
+    "imageHeight",
+    "Fov",
+    "CameraF_y",
+    "CameraR_y",
+    "CameraB_y",
+    "CameraL_y",
+    "CameraF_location_x",
+    "CameraR_location_x",
+    "CameraB_location_x",
+    "CameraL_location_x",
+    "CameraF_location_y",
+    "CameraR_location_y",
+    "CameraB_location_y",
+    "CameraL_location_y",
+    "CameraF_location_z",
+    "CameraR_location_z",
+    "CameraB_location_z",
+    "CameraL_location_z",
+]
+initTextureFields = ["imageWidth", "imageHeight"]
+initPointFields = ["numLidars", "lidarRes", "lidarChs"]
+
+
+def InitSVM(base, header):
+    # header : the init packet fields the frame was decoded with
+    # every init packet is parsed again by the receiver, only the resources whose fields changed since the last call
+    # are rebuilt: view-projection matrices (camera poses, Fov, resolution), camera/semantic texture arrays
+    # (resolution) and the lidar point Geom (lidar count and resolution)
+    previous = base.svmHeader if base.isInitializedUDP else None
+
+    def changed(fields):
+        return previous is None or any(previous[field] != header[field] for field in fields)
+
+    rebuildView = changed(initViewFields)
+    rebuildTextures = changed(initTextureFields)
+    rebuildPoints = changed(initPointFields)
+    if not (rebuildView or rebuildTextures or rebuildPoints):
+        return
+
+    base.isInitializedUDP = True
+    base.svmHeader = {field: header[field] for field in initViewFields + initPointFields}
+    imageWidth = header["imageWidth"]
+    imageHeight = header["imageHeight"]
+
+    # print(("Num Lidars : {Num}").format(Num=numLidars))
+    # print(("Lidar Channels : {Num}").format(Num=lidarChs))
+    # print(("Camera Width : {Num}").format(Num=imageWidth))
+    # print(("Camera Height : {Num}").format(Num=imageHeight))
+
+    if rebuildPoints:
+        instrumentation.count("InitSVM.points")
+        base.lidarRes = header["lidarRes"]
+        base.lidarChs = header["lidarChs"]
+        base.numLidars = header["numLidars"]
+
+        if base.isPointCloudSetup:
+            base.points.removeNode()
+        GeneratePointNode(base)
 
-    base.semanticTexArray.setup2dTextureArray(imageWidth, imageHeight, 4, p3d.Texture.T_int, p3d.Texture.F_r32i)
-    base.plane.setShaderInput("semanticImgs", base.semanticTexArray)
+    if rebuildView:
+        instrumentation.count("InitSVM.view")
+        base.matViewProjs, sensorMatLHS_array = ComputeViewProjs(header, imageWidth, imageHeight)
+        base.plane.setShaderInput("camPositions", base.camPositions)
 
-    base.sensorMatLHS_array = sensorMatLHS_array
+        for imgIdx, viewProjMat in enumerate(base.matViewProjs):
+            base.plane.setShaderInput("matViewProj" + str(imgIdx), viewProjMat)
+            base.interquad.setShaderInput("matViewProj" + str(imgIdx), viewProjMat)
+            # base.sphere.setShaderInput("matViewProj" + str(imgIdx), viewProjMat)
 
-    base.plane.setShaderInput("img_w", imageWidth)
-    base.plane.setShaderInput("img_h", imageHeight)
+        base.sensorMatLHS_array = sensorMatLHS_array
 
-    base.interquad.setShaderInput("img_w", imageWidth)
-    base.interquad.setShaderInput("img_h", imageHeight)
+    if rebuildTextures:
+        instrumentation.count("InitSVM.textures")
+        base.planeTexArray.setup2dTextureArray(
+            imageWidth, imageHeight, 4, p3d.Texture.T_unsigned_byte, p3d.Texture.F_rgba
+        )
+        base.plane.setShaderInput("cameraImgs", base.planeTexArray)
+        # base.sphere.setShaderInput("cameraImgs", base.planeTexArray)
+
+        base.semanticTexArray.setup2dTextureArray(imageWidth, imageHeight, 4, p3d.Texture.T_int, p3d.Texture.F_r32i)
+        base.plane.setShaderInput("semanticImgs", base.semanticTexArray)
+
+        base.plane.setShaderInput("img_w", imageWidth)
+        base.plane.setShaderInput("img_h", imageHeight)
+
+        base.interquad.setShaderInput("img_w", imageWidth)
+        base.interquad.setShaderInput("img_h", imageHeight)
 
     # print("Texture Initialized!")
 
 
-def ProcSvmFromPackets(base, numLidars, lidarRes, lidarChs, imageWidth, imageHeight, imgs, segs, worldpointlist):
-    InitSVM(
-        base,
-        numLidars,
-        lidarRes,
-        lidarChs,
-        imageWidth,
-        imageHeight,
-        imgs,
-        worldpointlist,
-    )
+def ProcSvmFromPackets(base, header, imgs, segs, worldpointlist):
+    InitSVM(base, header)
 
     def poisson_interpolation(sparse_map, segmentation_map):
         """
@@ -698,44 +815,125 @@ def ProcSvmFromPackets(base, numLidars, lidarRes, lidarChs, imageWidth, imageHei
         return solution.reshape(rows, cols)
 
     if base.isPointCloudSetup:
-        maxNumPoints = base.lidarRes * base.lidarChs * base.numLidars
-
-        base.pointsVertex.setRow(0)
-        base.pointsColor.setRow(0)
-
-        if base.isPointCloudVisible:
-            for i in range(maxNumPoints):
-                if i < len(worldpointlist):
-                    x, y, z = worldpointlist[i]
-                    base.pointsVertex.setData3f(x, y, z)
-                    base.pointsColor.setData4f(1, 1, 0, 1)  # Setting the color to yellow
-                else:
-                    base.pointsVertex.setData3f(10000, 10000, 10000)
-                    base.pointsColor.setData4f(0, 0, 0, 0)
-        else:
-            for i in range(maxNumPoints):
+        with instrumentation.timer("ProcSvmFromPackets.points"):
+            UploadPoints(base, worldpointlist)
+        with instrumentation.timer("ProcSvmFromPackets.textures"):
+            UploadTextures(base, header["imageWidth"], header["imageHeight"], imgs, segs)
+
+
+def UploadPoints(base, worldpointlist):
+    maxNumPoints = base.lidarRes * base.lidarChs * base.numLidars
+
+    base.pointsVertex.setRow(0)
+    base.pointsColor.setRow(0)
+
+    if base.isPointCloudVisible:
+        for i in range(maxNumPoints):
+            if i < len(worldpointlist):
+                x, y, z = worldpointlist[i]
+                base.pointsVertex.setData3f(x, y, z)
+                base.pointsColor.setData4f(1, 1, 0, 1)  # Setting the color to yellow
+            else:
                 base.pointsVertex.setData3f(10000, 10000, 10000)
                 base.pointsColor.setData4f(0, 0, 0, 0)
+    else:
+        for i in range(maxNumPoints):
+            base.pointsVertex.setData3f(10000, 10000, 10000)
+            base.pointsColor.setData4f(0, 0, 0, 0)
 
-        imgnpArray = np.array(imgs).astype(np.uint8)
-        imgArray = imgnpArray.reshape((4, imageHeight, imageWidth, 4))
-        cameraArray = imgArray[:, :, :, :].copy()
-        semanticArray = np.array(segs).astype(np.uint32)
 
-        base.planeTexArray.setRamImage(cameraArray)
+def UploadTextures(base, imageWidth, imageHeight, imgs, segs):
+    imgnpArray = np.array(imgs).astype(np.uint8)
+    imgArray = imgnpArray.reshape((4, imageHeight, imageWidth, 4))
+    cameraArray = imgArray[:, :, :, :].copy()
+
+    base.planeTexArray.setRamImage(cameraArray)
+    # segs is None while the label source has no new labels, keep the previous ones
+    if segs is not None:
+        semanticArray = np.array(segs).astype(np.uint32)
         base.semanticTexArray.setRamImage(semanticArray)
 
 
+def Undistort(base, packetInit, imgs, segs):
+    # the maps are built on the first fisheye frame and again when the resolution or the Fov changes
+    imageWidth = packetInit["imageWidth"]
+    imageHeight = packetInit["imageHeight"]
+    fov = packetInit["Fov"]
+    if base.undistorter is None or not base.undistorter.matches(imageWidth, imageHeight, fov):
+        if base.undistorter is not None:
+            base.undistorter.close()
+        intrinsics = undistort_stage.load_intrinsics(undistortCalibration)
+        base.undistorter = undistort_stage.Undistorter(intrinsics, imageWidth, imageHeight, fov, undistortThreads)
+    return base.undistorter.apply(imgs, segs)
+
+
+def ConfigureHeadless():
+    # must run before the ShowBase is created
+    p3d.loadPrcFileData(
+        "",
+        "window-type offscreen\nload-display {}\nwin-size {} {}\naudio-library-name null".format(
+            headlessDisplay, winSizeX, winSizeY
+        ),
+    )
+
+
+def ReadComposite(base):
+    # final composite of the last rendered frame as (H, W, 4) BGRA, top row first
+    tex = base.win.getScreenshot()
+    image = np.frombuffer(tex.getRamImageAs("BGRA"), np.uint8).reshape((tex.getYSize(), tex.getXSize(), 4))
+    return np.flipud(image)
+
+
+def RunHeadless(base, numFrames, sink=None):
+    for _ in range(numFrames):
+        with instrumentation.timer("headless.render"):
+            base.taskMgr.step()
+        with instrumentation.timer("headless.readback"):
+            frame = ReadComposite(base)
+        if sink is not None:
+            with instrumentation.timer("headless.output"):
+                sink.write(frame)
+    instrumentation.dump()
+
+
+def RunHeadlessCpu(base, q: queue.Queue, numFrames, sink=None):
+    import birdseye_remap
+
+    tables = None
+    tablesHeader = None
+    frames = 0
+    while frames < numFrames:
+        frameData = q.get()
+        imgs = frameData[1]
+        header = frameData[5]
+        if header["isFisheye"]:
+            with instrumentation.timer("PacketProcessing.undistort"):
+                imgs, _ = Undistort(base, header, imgs, None)
+
+        # the tables depend on the fields the view-projection matrices are computed from
+        viewHeader = [header[field] for field in initViewFields]
+        if viewHeader != tablesHeader:
+            with instrumentation.timer("headless.tables"):
+                matViewProjs, _ = ComputeViewProjs(header, header["imageWidth"], header["imageHeight"])
+                tables = birdseye_remap.load_or_build(
+                    matViewProjs, header["imageWidth"], header["imageHeight"], winSizeX, winSizeY
+                )
+            tablesHeader = viewHeader
+
+        with instrumentation.timer("headless.stitch"):
+            frame = tables.composite(imgs)
+        if sink is not None:
+            with instrumentation.timer("headless.output"):
+                sink.write(frame)
+        frames += 1
+    instrumentation.dump()
+
+
 def PacketProcessing(packetInit: dict, q: queue):
     # packetNum = packetInit["packetNum"]
     # bytesPoints = packetInit["bytesPoints"]
     # bytesDepthmap = packetInit["bytesDepthmap"]
     # bytesRGBmap = packetInit["bytesRGBmap"]
-    numLidars = packetInit["numLidars"]
-    lidarRes = packetInit["lidarRes"]
-    lidarChs = packetInit["lidarChs"]
-    imageWidth = packetInit["imageWidth"]
-    imageHeight = packetInit["imageHeight"]
 
     if q.empty():
         time.sleep(0.02)
@@ -745,6 +943,22 @@ def PacketProcessing(packetInit: dict, q: queue):
     imgs = frameData[1]
     segImg = frameData[2]
     segRaw = frameData[3]
+    wireFrame = frameData[4]
+    # init packet fields the frame was decoded with, packetInit may already hold the next init packet
+    header = frameData[5]
+    frame_trace.mark(wireFrame, "dequeued")
+
+    if header["isFisheye"]:
+        with instrumentation.timer("PacketProcessing.undistort"):
+            imgs, segRaw = Undistort(mySvm, header, imgs, segRaw)
+
+    mySvm.frameCount += 1
+    with instrumentation.timer("PacketProcessing.labels"):
+        segRaw = mySvm.labelSource.labels(mySvm.frameCount, imgs, segRaw)
+    # labels of frames before a resolution change (modelAsync) do not fit the reallocated texture array
+    if segRaw is not None and segRaw.shape[1:] != (header["imageHeight"], header["imageWidth"]):
+        instrumentation.count("PacketProcessing.staleLabels")
+        segRaw = None
 
     # cv.namedWindow("img 0", cv.WINDOW_GUI_NORMAL)
     # cv.namedWindow("img 1", cv.WINDOW_GUI_NORMAL)
@@ -784,10 +998,25 @@ def PacketProcessing(packetInit: dict, q: queue):
 
     # cv.waitKey(1)
 
-    ProcSvmFromPackets(mySvm, numLidars, lidarRes, lidarChs, imageWidth, imageHeight, imgs, segRaw, worldpointList)
+    with instrumentation.timer("ProcSvmFromPackets"):
+        ProcSvmFromPackets(mySvm, header, imgs, segRaw, worldpointList)
+    frame_trace.mark(wireFrame, "uploaded")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Surround view from the simulator sensor stream")
+    parser.add_argument("--headless", action="store_true", default=headless)
+    parser.add_argument("--frames", type=int, default=headlessFrames, help="headless: frames to render")
+    parser.add_argument("--output", choices=["png", "shm"], default=headlessOutput, help="headless: frame sink")
+    parser.add_argument("--output-path", default=headlessOutputPath)
+    parser.add_argument("--stitch", choices=["gpu", "cpu"], default=headlessStitch, help="headless: compositing")
+    parser.add_argument("--source", choices=["udp", "synthetic"], default=frameSourceName)
+    args = parser.parse_args()
+    headless = args.headless
+    frameSourceName = args.source
+
+    if headless:
+        ConfigureHeadless()
     mySvm = SurroundView()
     mySvm.isInitializedUDP = False
 
@@ -800,14 +1029,66 @@ if __name__ == "__main__":
 
     mySvm.qQ = q
     mySvm.packetInit = packetInit
+
+    mySvm.frameCount = 0
+    mySvm.labelSource = label_source.make_label_source(labelSourceName)
+    mySvm.accept("l", lambda: print(mySvm.labelSource.metrics()))
+    instrumentation.enable(instrumentationEnabled or headless)
+    mySvm.accept("t", instrumentation.dump)
+    mySvm.accept(
+        "u", lambda: print("undistort ms per camera : {}".format(mySvm.undistorter and mySvm.undistorter.stats()))
+    )
+    frame_trace.enable(traceEnabled)
+    mySvm.accept("x", lambda: (print(frame_trace.summary()), frame_trace.export_chrome(tracePath)))
+    if instrumentationEnabled and instrumentationLog is not None:
+        instrumentation.start_periodic_dump(instrumentationLog, instrumentationInterval)
     mySvm.taskMgr.add(UpdateResource, "UpdateResource", sort=0)
+    recorder = None
+    if recordPath is not None:
+        import frame_recorder
+
+        recorder = frame_recorder.FrameRecorder(frame_recorder.run_log_path(recordPath))
+        mySvm.accept("c", lambda: print("recorded {}, dropped {}".format(recorder.recorded, recorder.dropped)))
     # print("UDP server up and listening")
-    t1 = threading.Thread(target=UDP_ReceiverSingle.ReceiveData, args=(packetInit, q))
+    if frameSourceName == "synthetic":
+        import synthetic_frames
 
+        t1 = threading.Thread(
+            target=synthetic_frames.feed_queue,
+            args=(synthetic_frames.SyntheticFrames(), packetInit, q, None, 30.0, mySvm.labelSource.decodesGroundTruth),
+        )
+    else:
+        t1 = threading.Thread(
+            target=UDP_ReceiverSingle.ReceiveData,
+            args=(packetInit, q, mySvm.labelSource.decodesGroundTruth, recorder),
+        )
+
+    # headless runs end after the batch, the receiver must not keep the process alive
+    t1.daemon = headless
     t1.start()
 
-    while True:
-        if len(packetInit) != 0:
+    while len(packetInit) == 0:
+        time.sleep(0.01)
+
+    try:
+        if headless:
+            import headless_output
+
+            sink = None
+            if args.output == "png":
+                sink = headless_output.PngWriter(args.output_path)
+            elif args.output == "shm":
+                sink = headless_output.SharedMemoryRing(args.output_path, winSizeX, winSizeY)
+            if args.stitch == "cpu":
+                RunHeadlessCpu(mySvm, q, args.frames, sink)
+            else:
+                RunHeadless(mySvm, args.frames, sink)
+            if sink is not None:
+                sink.close()
+        else:
             # print("run")
             mySvm.run()
-            break
+    finally:
+        # flushes the frames still queued for the log
+        if recorder is not None:
+            recorder.close()
@@ -6,10 +6,17 @@ import cv2 as cv
 import numpy as np
 
 import DepthToPoint
+import frame_trace
+import instrumentation
 
 # import time
 
 
+# SO_RCVBUF of the receive socket, None keeps the OS default (~200 KB on Linux, capped by net.core.rmem_max)
+# a frame arrives as one burst of datagrams (about 8 MB at 4 x 1024 x 1024 camera and semantic images), a buffer
+# smaller than the burst loses datagrams while the decode of the previous frame holds the receive loop
+receiveBufferBytes = 8 << 20
+
 color_map = [
     (128, 64, 128),
     (244, 35, 232),
@@ -33,23 +40,168 @@ color_map = [
 ]
 
 
-def ReceiveData(packetInit: dict, q: queue.Queue):
+def ParseInitPacket(packet, packetInit: dict):
+    # init packet (frame 0xFFFFFFFF) -> packetInit fields
+    packetInit["packetNum"] = int.from_bytes(packet[4:8], "little")
+    packetInit["bytesPoints"] = int.from_bytes(packet[8:12], "little")
+    packetInit["bytesDepthmap"] = int.from_bytes(packet[12:16], "little")
+    packetInit["bytesRGBmap"] = int.from_bytes(packet[16:20], "little")
+    packetInit["numLidars"] = int.from_bytes(packet[20:24], "little")
+    packetInit["lidarRes"] = int.from_bytes(packet[24:28], "little")
+    packetInit["lidarChs"] = int.from_bytes(packet[28:32], "little")
+    packetInit["imageWidth"] = int.from_bytes(packet[32:36], "little")
+    packetInit["imageHeight"] = int.from_bytes(packet[36:40], "little")
+    packetInit["Fov"] = int.from_bytes(packet[40:44], "little")
+
+    packetInit["CameraF_y"] = int.from_bytes(packet[44:48], "little", signed=True)
+    packetInit["CameraR_y"] = int.from_bytes(packet[48:52], "little", signed=True)
+    packetInit["CameraB_y"] = int.from_bytes(packet[52:56], "little", signed=True)
+    packetInit["CameraL_y"] = int.from_bytes(packet[56:60], "little", signed=True)
+
+    packetInit["CameraF_location_x"] = int.from_bytes(packet[60:64], "little", signed=True)
+    packetInit["CameraR_location_x"] = int.from_bytes(packet[64:68], "little", signed=True)
+    packetInit["CameraB_location_x"] = int.from_bytes(packet[68:72], "little", signed=True)
+    packetInit["CameraL_location_x"] = int.from_bytes(packet[72:76], "little", signed=True)
+
+    packetInit["CameraF_location_y"] = int.from_bytes(packet[76:80], "little", signed=True)
+    packetInit["CameraR_location_y"] = int.from_bytes(packet[80:84], "little", signed=True)
+    packetInit["CameraB_location_y"] = int.from_bytes(packet[84:88], "little", signed=True)
+    packetInit["CameraL_location_y"] = int.from_bytes(packet[88:92], "little", signed=True)
+
+    packetInit["CameraF_location_z"] = int.from_bytes(packet[92:96], "little", signed=True)
+    packetInit["CameraR_location_z"] = int.from_bytes(packet[96:100], "little", signed=True)
+    packetInit["CameraB_location_z"] = int.from_bytes(packet[100:104], "little", signed=True)
+    packetInit["CameraL_location_z"] = int.from_bytes(packet[104:108], "little", signed=True)
+
+    packetInit["isFisheye"] = int.from_bytes(packet[108:112], "little", signed=True)
+
+    # print("Num Packets : {}".format(packetInit["packetNum"]))
+    # print("Bytes of Points : {}".format(packetInit["bytesPoints"]))
+    # print("Bytes of RGB map : {}".format(packetInit["bytesRGBmap"]))
+    # print("Bytes of Depth map : {}".format(packetInit["bytesDepthmap"]))
+    # print("Num Lidars : {}".format(packetInit["numLidars"]))
+    # print("Lidar Resolution : {}".format(packetInit["lidarRes"]))
+    # print("Lidar Channels : {}".format(packetInit["lidarChs"]))
+    # print("Camera Width : {}".format(packetInit["imageWidth"]))
+    # print("Camera Height : {}".format(packetInit["imageHeight"]))
+    # print("Camera Fov : {}".format(packetInit["Fov"]))
+    # print(
+    #     "Camera rotate y: {}, {}, {}, {}".format(
+    #         packetInit["CameraF_y"], packetInit["CameraR_y"], packetInit["CameraB_y"], packetInit["CameraL_y"]
+    #     )
+    # )
+    # print(
+    #     "CameraF location: {}, {}, {}".format(
+    #         packetInit["CameraF_location_x"], packetInit["CameraF_location_y"], packetInit["CameraF_location_z"]
+    #     )
+    # )
+    # print(
+    #     "CameraR location: {}, {}, {}".format(
+    #         packetInit["CameraR_location_x"], packetInit["CameraR_location_y"], packetInit["CameraR_location_z"]
+    #     )
+    # )
+    # print(
+    #     "CameraB location: {}, {}, {}".format(
+    #         packetInit["CameraB_location_x"], packetInit["CameraB_location_y"], packetInit["CameraB_location_z"]
+    #     )
+    # )
+    # print(
+    #     "CameraL location: {}, {}, {}".format(
+    #         packetInit["CameraL_location_x"], packetInit["CameraL_location_y"], packetInit["CameraL_location_z"]
+    #     )
+    # )
+
+
+def DecodeDepth(packetInit: dict, fullPackets):
+    # depth map block -> lidar world points
+    bytesDepthmap = packetInit["bytesDepthmap"]
+    lidarRes = packetInit["lidarRes"]
+    lidarChs = packetInit["lidarChs"]
+
+    depthmap = struct.unpack(str(lidarRes * lidarChs) + "f", fullPackets[0:bytesDepthmap])
+    depthmapnp = np.array(depthmap)
+
+    return DepthToPoint.toPoints(lidarChs, lidarRes, 30, 360, depthmapnp, (0, 0, 500))
+
+
+def DecodeImages(packetInit: dict, fullPackets, decodeSemantics=True):
+    # RGB block -> 4 camera images and 4 BGRA semantic images (None without decodeSemantics)
+    bytesDepthmap = packetInit["bytesDepthmap"]
+    bytesRGBmap = packetInit["bytesRGBmap"]
+    imageWidth = packetInit["imageWidth"]
+    imageHeight = packetInit["imageHeight"]
+
+    imgs = []
+    segs = []
+    offsetImg = bytesDepthmap
+    imgBytes = bytesRGBmap // (4 + 4)
+    dummyByte = 0
+
+    for _ in range(4):
+        imgnp = np.array(fullPackets[offsetImg + dummyByte : offsetImg + dummyByte + imgBytes], dtype=np.uint8)
+        imgnp = imgnp.reshape((imageHeight, imageWidth, 4))
+        imgs.append(imgnp)
+
+        if decodeSemantics:
+            segnp = np.array(
+                fullPackets[offsetImg + dummyByte + imgBytes : offsetImg + dummyByte + imgBytes + imgBytes],
+                dtype=np.uint8,
+            )
+            segs.append(segnp.reshape((imageHeight, imageWidth, 4)))
+        dummyByte = dummyByte + imgBytes + imgBytes
+
+    return imgs, segs if decodeSemantics else None
+
+
+def ColorizeSemantics(segnp):
+    # BGRA semantic image (class id in B) -> color_map image
+    color_img = np.zeros_like(segnp).astype(np.uint8)
+    for j, color in enumerate(color_map):
+        for k in range(3):
+            color_img[:, :, k][segnp[:, :, 0] == j] = color[k]
+    return color_img
+
+
+def DecodeFrame(packetInit: dict, fullPackets, decodeSemantics=True):
+    # reassembled frame payload -> [worldpointList, imgs, segs, segr], ReceiveData appends the wire frame number and
+    # the init packet fields before putting it on the queue
+    fullPackets = bytearray(fullPackets)
+
+    worldpointList = DecodeDepth(packetInit, fullPackets)
+    imgs, segBgra = DecodeImages(packetInit, fullPackets, decodeSemantics)
+
+    if not decodeSemantics:
+        return [worldpointList, imgs, None, None]
+
+    segs = [ColorizeSemantics(segnp) for segnp in segBgra]
+    segr = [cv.cvtColor(segnp, cv.COLOR_BGRA2GRAY) for segnp in segBgra]
+    return [worldpointList, imgs, segs, segr]
+
+
+def ReceiveData(packetInit: dict, q: queue.Queue, decodeSemantics=True, recorder=None):
+    # decodeSemantics=False skips the ground-truth semantic images (every other image of the RGB block),
+    # segs/segr are then None (labels come from label_source instead)
+    # recorder (frame_recorder.FrameRecorder) logs every reassembled frame with its init packet
     localIP = "127.0.0.1"
     localPort = 12000
     bufferSize = 60000
 
     UDPServerSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
-
+    if receiveBufferBytes is not None:
+        UDPServerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receiveBufferBytes)
     UDPServerSocket.bind((localIP, localPort))
     # timeout = 5
     # UDPServerSocket.settimeout(timeout)
 
     packetDict = {}
+    initPacket = b""
+    header = None
 
     while True:
         bytesAddressPair = UDPServerSocket.recvfrom(bufferSize)
 
         packet = bytesAddressPair[0]
+        instrumentation.count("ReceiveData.datagrams")
 
         frame = int.from_bytes(packet[0:4], "little")
         count = int.from_bytes(packet[4:8], "little")
@@ -57,74 +209,11 @@ def ReceiveData(packetInit: dict, q: queue.Queue):
         if frame == 0xFFFFFFFF:  # initial packet
             # to do
             # modify initial packet
-            packetInit["packetNum"] = int.from_bytes(packet[4:8], "little")
-            packetInit["bytesPoints"] = int.from_bytes(packet[8:12], "little")
-            packetInit["bytesDepthmap"] = int.from_bytes(packet[12:16], "little")
-            packetInit["bytesRGBmap"] = int.from_bytes(packet[16:20], "little")
-            packetInit["numLidars"] = int.from_bytes(packet[20:24], "little")
-            packetInit["lidarRes"] = int.from_bytes(packet[24:28], "little")
-            packetInit["lidarChs"] = int.from_bytes(packet[28:32], "little")
-            packetInit["imageWidth"] = int.from_bytes(packet[32:36], "little")
-            packetInit["imageHeight"] = int.from_bytes(packet[36:40], "little")
-            packetInit["Fov"] = int.from_bytes(packet[40:44], "little")
-
-            packetInit["CameraF_y"] = int.from_bytes(packet[44:48], "little", signed=True)
-            packetInit["CameraR_y"] = int.from_bytes(packet[48:52], "little", signed=True)
-            packetInit["CameraB_y"] = int.from_bytes(packet[52:56], "little", signed=True)
-            packetInit["CameraL_y"] = int.from_bytes(packet[56:60], "little", signed=True)
-
-            packetInit["CameraF_location_x"] = int.from_bytes(packet[60:64], "little", signed=True)
-            packetInit["CameraR_location_x"] = int.from_bytes(packet[64:68], "little", signed=True)
-            packetInit["CameraB_location_x"] = int.from_bytes(packet[68:72], "little", signed=True)
-            packetInit["CameraL_location_x"] = int.from_bytes(packet[72:76], "little", signed=True)
-
-            packetInit["CameraF_location_y"] = int.from_bytes(packet[76:80], "little", signed=True)
-            packetInit["CameraR_location_y"] = int.from_bytes(packet[80:84], "little", signed=True)
-            packetInit["CameraB_location_y"] = int.from_bytes(packet[84:88], "little", signed=True)
-            packetInit["CameraL_location_y"] = int.from_bytes(packet[88:92], "little", signed=True)
-
-            packetInit["CameraF_location_z"] = int.from_bytes(packet[92:96], "little", signed=True)
-            packetInit["CameraR_location_z"] = int.from_bytes(packet[96:100], "little", signed=True)
-            packetInit["CameraB_location_z"] = int.from_bytes(packet[100:104], "little", signed=True)
-            packetInit["CameraL_location_z"] = int.from_bytes(packet[104:108], "little", signed=True)
-
-            packetInit["isFisheye"] = int.from_bytes(packet[108:112], "little", signed=True)
-
-            # print("Num Packets : {}".format(packetInit["packetNum"]))
-            # print("Bytes of Points : {}".format(packetInit["bytesPoints"]))
-            # print("Bytes of RGB map : {}".format(packetInit["bytesRGBmap"]))
-            # print("Bytes of Depth map : {}".format(packetInit["bytesDepthmap"]))
-            # print("Num Lidars : {}".format(packetInit["numLidars"]))
-            # print("Lidar Resolution : {}".format(packetInit["lidarRes"]))
-            # print("Lidar Channels : {}".format(packetInit["lidarChs"]))
-            # print("Camera Width : {}".format(packetInit["imageWidth"]))
-            # print("Camera Height : {}".format(packetInit["imageHeight"]))
-            # print("Camera Fov : {}".format(packetInit["Fov"]))
-            # print(
-            #     "Camera rotate y: {}, {}, {}, {}".format(
-            #         packetInit["CameraF_y"], packetInit["CameraR_y"], packetInit["CameraB_y"], packetInit["CameraL_y"]
-            #     )
-            # )
-            # print(
-            #     "CameraF location: {}, {}, {}".format(
-            #         packetInit["CameraF_location_x"], packetInit["CameraF_location_y"], packetInit["CameraF_location_z"]
-            #     )
-            # )
-            # print(
-            #     "CameraR location: {}, {}, {}".format(
-            #         packetInit["CameraR_location_x"], packetInit["CameraR_location_y"], packetInit["CameraR_location_z"]
-            #     )
-            # )
-            # print(
-            #     "CameraB location: {}, {}, {}".format(
-            #         packetInit["CameraB_location_x"], packetInit["CameraB_location_y"], packetInit["CameraB_location_z"]
-            #     )
-            # )
-            # print(
-            #     "CameraL location: {}, {}, {}".format(
-            #         packetInit["CameraL_location_x"], packetInit["CameraL_location_y"], packetInit["CameraL_location_z"]
-            #     )
-            # )
+            initPacket = packet
+            ParseInitPacket(packet, packetInit)
+            # a new dict per init packet, the frames on the queue keep the fields they were decoded with
+            header = dict(packetInit)
+            instrumentation.count("ReceiveData.initPackets")
 
         else:
             if not packetInit:
@@ -133,70 +222,34 @@ def ReceiveData(packetInit: dict, q: queue.Queue):
             # print("packet count : ", count)
             if frame not in packetDict:
                 packetDict[frame] = {}
+                frame_trace.mark(frame, "firstDatagram")
             packetDict[frame][count] = packet[8:]
             # print("count sum : ", len(packetDict[frame]))
             for key in list(packetDict.keys()):
                 packetNum = packetInit["packetNum"]
-                # bytesPoints = packetInit["bytesPoints"]
-                bytesDepthmap = packetInit["bytesDepthmap"]
-                bytesRGBmap = packetInit["bytesRGBmap"]
-                # numLidars = packetInit["numLidars"]
-                lidarRes = packetInit["lidarRes"]
-                lidarChs = packetInit["lidarChs"]
-                imageWidth = packetInit["imageWidth"]
-                imageHeight = packetInit["imageHeight"]
-                # fov = packetInit["Fov"]
-                # isFisheye = packetInit["isFisheye"]
 
                 if len(packetDict[key]) == packetNum:
                     fullPackets = b"".join([packetDict[frame][i] for i in range(packetNum)])
-                    fullPackets = bytearray(fullPackets)
-                    imgs = []
-                    segs = []
-                    segr = []
-                    offset = 0
-
-                    depthmap = struct.unpack(
-                        str(lidarRes * lidarChs) + "f", fullPackets[offset : offset + bytesDepthmap]
-                    )
-                    depthmapnp = np.array(depthmap)
-
-                    worldpointList = DepthToPoint.toPoints(lidarChs, lidarRes, 30, 360, depthmapnp, (0, 0, 500))
-
-                    offsetImg = bytesDepthmap + offset
-                    imgBytes = bytesRGBmap // (4 + 4)
-                    dummyByte = 0
-
-                    for _ in range(4):
-                        imgnp = np.array(
-                            fullPackets[offsetImg + dummyByte : offsetImg + dummyByte + imgBytes], dtype=np.uint8
-                        )
-                        segnp = np.array(
-                            fullPackets[offsetImg + dummyByte + imgBytes : offsetImg + dummyByte + imgBytes + imgBytes],
-                            dtype=np.uint8,
-                        )
-                        imgnp = imgnp.reshape((imageHeight, imageWidth, 4))
-                        segnp = segnp.reshape((imageHeight, imageWidth, 4))
-                        imgs.append(imgnp)
-
-                        color_img = np.zeros_like(segnp).astype(np.uint8)
-                        for j, color in enumerate(color_map):
-                            for k in range(3):
-                                color_img[:, :, k][segnp[:, :, 0] == j] = color[k]
-
-                        segnp = cv.cvtColor(segnp, cv.COLOR_BGRA2GRAY)
-                        segs.append(color_img)
-                        segr.append(segnp)
-                        dummyByte = dummyByte + imgBytes + imgBytes
+                    frame_trace.mark(key, "reassembled")
+                    if recorder is not None:
+                        recorder.record(key, initPacket, fullPackets)
+                    with instrumentation.timer("ReceiveData.decode"):
+                        decoded = DecodeFrame(packetInit, fullPackets, decodeSemantics)
+                    instrumentation.count("ReceiveData.frames")
+                    # the wire frame number travels with the frame for frame_trace, the init packet fields for the SVM
+                    decoded.append(key)
+                    decoded.append(header)
 
                     # print("queue size : ", q.qsize())
                     if q.full():
-                        q.get()
+                        frame_trace.drop(q.get()[4])
+                        instrumentation.count("ReceiveData.queueDrops")
                     # print(frame)
                     # print("dic len defor : ", len(packetDict))
                     # print("send : ", key)
 
-                    q.put([worldpointList, imgs, segs, segr])
+                    q.put(decoded)
+                    frame_trace.mark(key, "queued")
                     del packetDict[key]
                     # print("dic len after : ", len(packetDict))
                     # time.sleep(0.003)
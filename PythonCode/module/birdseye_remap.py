@@ -0,0 +1,226 @@
+import argparse
+import hashlib
+import os
+import time
+
+import cv2 as cv
+import numpy as np
+
+import svm_plane_reference
+
+# CPU top-down stitching with precomputed cv.remap tables.
+# The cameras are fixed once InitSVM has run, so the source texel of every top-down pixel and its blend weight are
+# constant. RemapTables holds the fixed-point remap maps into the four camera images and the blending weights of
+# svm_post1_ps.glsl on the water plane:
+#   seen by one camera                        : 1
+#   seen by a neighbouring pair (0-1, 1-2, ..) : sin^2 feathering across the overlap, biased by w01, w12, w23, w30
+#   anything else                             : black
+# A frame is then two remaps over the stacked camera images and a per-pixel weighted sum. The height correction of the
+# post pass (semantics 1 and 2 sampled at z = 60) depends on the frame and is not part of the tables.
+# The tables are cached in cacheDir as <calibration hash>.npz, see load_or_build().
+# SVM_thread.py --headless --stitch cpu composites the received frames with them.
+
+cacheDir = "remap_cache"
+
+# camera pairs blended by svm_post1_ps.glsl, (camId0, camId1) with the weight of camId0
+blendPairs = [(0, 1), (1, 2), (2, 3), (3, 0)]
+
+
+def calibration_key(matViewProjs, imageWidth, imageHeight, viewWidth, viewHeight, fov, camHeight, blendWeights):
+    h = hashlib.sha1()
+    h.update(np.array([np.array(mat, dtype=np.float32) for mat in matViewProjs]).tobytes())
+    h.update(np.array([imageWidth, imageHeight, viewWidth, viewHeight], dtype=np.int64).tobytes())
+    h.update(np.array([fov, camHeight] + list(blendWeights), dtype=np.float64).tobytes())
+    return h.hexdigest()[:16]
+
+
+def blend_weights(texPos, visible, blendWeights=(0.5, 0.5, 0.5, 0.5)):
+    # -> (4, H, W) float32 weight of every camera, the blendArea() weights of svm_post1_ps.glsl
+    count = visible.sum(axis=0)
+    weights = np.zeros(visible.shape, dtype=np.float32)
+    for i in range(len(visible)):
+        weights[i] = visible[i] & (count == 1)
+
+    for (cam0, cam1), bias in zip(blendPairs, blendWeights):
+        pair = visible[cam0] & visible[cam1] & (count == 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w0 = texPos[cam0, ..., 0] * bias
+            w1 = (1.0 - texPos[cam1, ..., 0]) * (1.0 - bias)
+            w0 = np.sin(w0 / (w0 + w1) * np.pi * 0.5) ** 2
+        w0 = np.nan_to_num(w0)
+        weights[cam0] = np.where(pair, w0, weights[cam0])
+        weights[cam1] = np.where(pair, 1.0 - w0, weights[cam1])
+    return weights
+
+
+class RemapTables:
+    # The four camera images are sampled as one atlas, stacked top to bottom like planeTexArray in RAM. Every
+    # top-down pixel takes a primary and a secondary camera (the same one outside the overlaps), a frame is
+    #   cv.blendLinear(remap(atlas, primary), remap(atlas, secondary), weight, 1 - weight)
+    # Pixels no camera pair covers point outside the atlas and come out black.
+
+    def __init__(self, maps, weight, imageWidth, imageHeight):
+        # maps : fixed-point (CV_16SC2, CV_16UC1) maps of the primary and the secondary camera (cv.convertMaps)
+        # weight : float32 weight of the primary camera
+        self.maps = maps
+        self.weight = weight
+        self.weightSecondary = 1.0 - weight
+        self.imageWidth = imageWidth
+        self.imageHeight = imageHeight
+        self.viewHeight, self.viewWidth = weight.shape
+
+    @classmethod
+    def build(
+        cls,
+        matViewProjs,
+        imageWidth,
+        imageHeight,
+        viewWidth,
+        viewHeight,
+        fov=60,
+        camHeight=3000,
+        blendWeights=(0.5, 0.5, 0.5, 0.5),
+    ):
+        # top row first, like the frames of ReadComposite()
+        positions = svm_plane_reference.view_positions(viewWidth, viewHeight, fov, camHeight)[::-1]
+        texPos, visible = svm_plane_reference.project(positions, matViewProjs)
+        weights = blend_weights(texPos, visible, blendWeights)
+
+        # texture(cameraImgs, vec3(1 - u, 1 - v, i)) in atlas pixel coordinates (texel centres at + 0.5), clamped to
+        # the camera's own rows so the bilinear taps never reach the neighbouring image
+        texPos = np.nan_to_num(texPos)
+        mapX = np.clip((1.0 - texPos[..., 0]) * imageWidth - 0.5, 0, imageWidth - 1)
+        mapY = np.clip((1.0 - texPos[..., 1]) * imageHeight - 0.5, 0, imageHeight - 1)
+        mapY += (np.arange(len(matViewProjs)) * imageHeight)[:, None, None]
+
+        order = np.argsort(-weights, axis=0)
+        primary, secondary = order[0], order[1]
+        covered = np.take_along_axis(weights, primary[None], 0)[0] > 0
+        secondary = np.where(np.take_along_axis(weights, secondary[None], 0)[0] > 0, secondary, primary)
+
+        maps = []
+        for cam in [primary, secondary]:
+            x = np.where(covered, np.take_along_axis(mapX, cam[None], 0)[0], -2).astype(np.float32)
+            y = np.where(covered, np.take_along_axis(mapY, cam[None], 0)[0], -2).astype(np.float32)
+            maps.append(cv.convertMaps(x, y, cv.CV_16SC2))
+        weight = np.take_along_axis(weights, primary[None], 0)[0].astype(np.float32)
+        return cls(maps, weight, imageWidth, imageHeight)
+
+    def save(self, path):
+        (p1, p2), (s1, s2) = self.maps
+        np.savez(
+            path,
+            primary1=p1,
+            primary2=p2,
+            secondary1=s1,
+            secondary2=s2,
+            weight=self.weight,
+            imageSize=np.array([self.imageWidth, self.imageHeight]),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            maps = [(f["primary1"], f["primary2"]), (f["secondary1"], f["secondary2"])]
+            imageWidth, imageHeight = [int(v) for v in f["imageSize"]]
+            return cls(maps, f["weight"], imageWidth, imageHeight)
+
+    def composite(self, imgs):
+        # imgs : the four camera images as uploaded to planeTexArray, a list or one (4, h, w, c) array
+        # -> (viewHeight, viewWidth, c) uint8, top row first
+        if isinstance(imgs, np.ndarray):
+            atlas = imgs.reshape((-1,) + imgs.shape[2:])
+        else:
+            atlas = np.concatenate(imgs, axis=0)
+        channels = 1 if atlas.ndim == 2 else atlas.shape[2]
+        border = (0, 0, 0, 255)[:channels] if channels == 4 else 0
+        warped = [
+            cv.remap(atlas, map1, map2, cv.INTER_LINEAR, borderMode=cv.BORDER_CONSTANT, borderValue=border)
+            for map1, map2 in self.maps
+        ]
+        return cv.blendLinear(warped[0], warped[1], self.weight, self.weightSecondary)
+
+
+def load_or_build(
+    matViewProjs,
+    imageWidth,
+    imageHeight,
+    viewWidth,
+    viewHeight,
+    fov=60,
+    camHeight=3000,
+    blendWeights=(0.5, 0.5, 0.5, 0.5),
+    directory=None,
+):
+    # RemapTables for the calibration, read from the cache when built before
+    directory = directory or cacheDir
+    key = calibration_key(matViewProjs, imageWidth, imageHeight, viewWidth, viewHeight, fov, camHeight, blendWeights)
+    path = os.path.join(directory, key + ".npz")
+    if os.path.exists(path):
+        return RemapTables.load(path)
+
+    tables = RemapTables.build(
+        matViewProjs, imageWidth, imageHeight, viewWidth, viewHeight, fov, camHeight, blendWeights
+    )
+    os.makedirs(directory, exist_ok=True)
+    # written under a temporary name first so a concurrent reader never loads a partial file
+    tmpPath = os.path.join(directory, key + ".tmp.npz")
+    tables.save(tmpPath)
+    os.replace(tmpPath, path)
+    return tables
+
+
+if __name__ == "__main__":
+    import SVM_thread
+    import UDP_ReceiverSingle
+    from frame_recorder import FrameLog
+    from headless_output import PngWriter
+    from synthetic_frames import SyntheticFrames
+
+    parser = argparse.ArgumentParser(description="Top-down composites on the CPU with precomputed remap tables")
+    parser.add_argument("--log", default=None, help="frame log (frame_recorder.py), default: synthetic frames")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--image", default="1024x1024", help="synthetic camera resolution")
+    parser.add_argument("--view", type=int, default=SVM_thread.winSizeX, help="top-down image size")
+    parser.add_argument("--output-path", default=None, help="write the composites as PNGs into this directory")
+    parser.add_argument("--cache-dir", default=cacheDir)
+    args = parser.parse_args()
+
+    if args.log is not None:
+        log = FrameLog(args.log)
+        frames = (log.read(k % len(log))[2:] for k in range(args.frames))
+    else:
+        width, height = [int(v) for v in args.image.split("x")]
+        gen = SyntheticFrames(64, 8, width, height)
+        frames = ((gen.initPacket(0), gen.frame(k)) for k in range(args.frames))
+
+    sink = PngWriter(args.output_path) if args.output_path is not None else None
+    tables = None
+    buildMs = 0.0
+    timings = []
+    for initPacket, payload in frames:
+        if tables is None:
+            packetInit = {}
+            UDP_ReceiverSingle.ParseInitPacket(initPacket, packetInit)
+            imageWidth, imageHeight = packetInit["imageWidth"], packetInit["imageHeight"]
+            matViewProjs, _ = SVM_thread.ComputeViewProjs(packetInit, imageWidth, imageHeight)
+            t_start = time.perf_counter()
+            tables = load_or_build(
+                matViewProjs, imageWidth, imageHeight, args.view, args.view, directory=args.cache_dir
+            )
+            buildMs = (time.perf_counter() - t_start) * 1000
+
+        imgs, _ = UDP_ReceiverSingle.DecodeImages(packetInit, bytearray(payload), False)
+        t_start = time.perf_counter()
+        composite = tables.composite(imgs)
+        timings.append(time.perf_counter() - t_start)
+        if sink is not None:
+            sink.write(composite)
+
+    ms = np.array(timings) * 1000
+    print("tables : {:.1f} ms (build or cache load)".format(buildMs))
+    print(
+        "composite : mean {:.2f} ms, p95 {:.2f} ms, {:.1f} fps".format(
+            ms.mean(), np.percentile(ms, 95), 1000 / ms.mean()
+        )
+    )
@@ -0,0 +1,139 @@
+import argparse
+import random
+import socket
+import struct
+import time
+
+from frame_recorder import FrameLog
+
+# Re-sends a frame log (see frame_recorder.py) in the wire format parsed by UDP_ReceiverSingle.ReceiveData:
+# init packet : frame 0xFFFFFFFF, packetNum, bytesPoints, ... (112 bytes)
+# data        : frame uint32, count uint32, payload chunk
+# Loss and reordering are drawn from a seeded generator so two runs with the same arguments send the same datagrams.
+
+initFrame = 0xFFFFFFFF
+dataHeader = struct.Struct("<II")
+# ReceiveData reads with recvfrom(60000)
+maxDatagramBytes = 60000 - dataHeader.size
+
+
+def packetize(frame, payload, datagramBytes):
+    return [
+        dataHeader.pack(frame, count) + payload[offset : offset + datagramBytes]
+        for count, offset in enumerate(range(0, len(payload), datagramBytes))
+    ]
+
+
+def with_packet_num(initPacket, packetNum):
+    # the receiver waits for packetNum datagrams per frame, this changes with the datagram size
+    return initPacket[:4] + struct.pack("<I", packetNum) + initPacket[8:]
+
+
+class ReplaySender:
+    def __init__(self, address, datagramBytes=50000, loss=0.0, reorder=0.0, seed=0):
+        if not 0 < datagramBytes <= maxDatagramBytes:
+            raise ValueError("datagramBytes must be in (0, {}]".format(maxDatagramBytes))
+        self.address = address
+        self.datagramBytes = datagramBytes
+        self.loss = loss
+        self.reorder = reorder
+        self.random = random.Random(seed)
+
+        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8 << 20)
+        self.lastInit = None
+
+        self.frames = 0
+        self.datagrams = 0
+        self.bytesSent = 0
+        self.datagramsLost = 0
+        self.datagramsReordered = 0
+
+    def send(self, frame, initPacket, payload):
+        datagrams = packetize(frame, payload, self.datagramBytes)
+        initPacket = with_packet_num(initPacket, len(datagrams))
+        # like the simulator, the init packet is only sent when the layout changes
+        if initPacket != self.lastInit:
+            self.socket.sendto(initPacket, self.address)
+            self.lastInit = initPacket
+
+        if self.reorder > 0:
+            for i in range(len(datagrams) - 1):
+                if self.random.random() < self.reorder:
+                    datagrams[i], datagrams[i + 1] = datagrams[i + 1], datagrams[i]
+                    self.datagramsReordered += 1
+
+        for datagram in datagrams:
+            if self.loss > 0 and self.random.random() < self.loss:
+                self.datagramsLost += 1
+                continue
+            self.socket.sendto(datagram, self.address)
+            self.datagrams += 1
+            self.bytesSent += len(datagram)
+        self.frames += 1
+
+    def close(self):
+        self.socket.close()
+
+
+def replay(log, sender, mode="realtime", speed=1.0, fps=30.0, loops=1):
+    # mode "realtime" : recorded frame spacing divided by speed
+    #      "fps"      : fixed frame rate
+    #      "max"      : as fast as the socket accepts
+    t_start = time.perf_counter()
+    sendTime = t_start
+    frameNumber = 0
+    for _ in range(loops):
+        firstStamp = None
+        loopStart = time.perf_counter()
+        for frame, stamp, initPacket, payload in log:
+            if mode == "realtime":
+                if firstStamp is None:
+                    firstStamp = stamp
+                sendTime = loopStart + (stamp - firstStamp) / speed
+            elif mode == "fps":
+                sendTime += 1.0 / fps
+            wait = sendTime - time.perf_counter()
+            if mode != "max" and wait > 0:
+                time.sleep(wait)
+            # loops get consecutive frame numbers so the receiver never sees a frame twice
+            sender.send(frameNumber, initPacket, payload)
+            frameNumber += 1
+    elapsed = time.perf_counter() - t_start
+
+    return {
+        "frames": sender.frames,
+        "datagrams": sender.datagrams,
+        "lost": sender.datagramsLost,
+        "reordered": sender.datagramsReordered,
+        "seconds": elapsed,
+        "fps": sender.frames / elapsed if elapsed > 0 else 0.0,
+        "MBps": sender.bytesSent / elapsed / 1e6 if elapsed > 0 else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded frame log to UDP_ReceiverSingle over UDP")
+    parser.add_argument("log", help="frame log written by frame_recorder.FrameRecorder")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12000)
+    parser.add_argument("--mode", choices=["realtime", "fps", "max"], default="realtime")
+    parser.add_argument("--speed", type=float, default=1.0, help="realtime mode speed-up")
+    parser.add_argument("--fps", type=float, default=30.0, help="fps mode frame rate")
+    parser.add_argument("--loops", type=int, default=1)
+    parser.add_argument("--datagram-bytes", type=int, default=50000, help="payload bytes per datagram")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability of dropping a datagram")
+    parser.add_argument("--reorder", type=float, default=0.0, help="probability of swapping adjacent datagrams")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    log = FrameLog(args.log)
+    sender = ReplaySender((args.host, args.port), args.datagram_bytes, args.loss, args.reorder, args.seed)
+    stats = replay(log, sender, args.mode, args.speed, args.fps, args.loops)
+    sender.close()
+    log.close()
+
+    print(
+        "{frames} frames, {datagrams} datagrams ({lost} lost, {reordered} reordered) in {seconds:.2f} s : "
+        "{fps:.1f} fps, {MBps:.1f} MB/s".format(**stats)
+    )
@@ -0,0 +1,122 @@
+import collections
+import json
+import threading
+import time
+
+import numpy as np
+
+# Per-frame latency trace keyed by the wire frame number.
+# Stages, in pipeline order:
+#   firstDatagram : first datagram of the frame received (ReceiveData)
+#   reassembled   : all datagrams received and joined
+#   queued        : decoded frame put on the queue
+#   dequeued      : taken off the queue by PacketProcessing
+#   uploaded      : points and textures handed to Panda3D (ProcSvmFromPackets done)
+# Frames overwritten on the full queue (if q.full(): q.get()) get a "dropped" timestamp instead of the last two.
+# Timestamps are time.perf_counter() seconds (monotonic). Off unless enabled, mark() then returns right away.
+
+enabled = False
+maxFrames = 2000
+# total frames overwritten on the queue, also counts the ones evicted from the trace
+droppedFrames = 0
+
+stages = ["firstDatagram", "reassembled", "queued", "dequeued", "uploaded"]
+# span names between consecutive stages
+spans = ["reassembly", "decode", "queueWait", "process"]
+
+_frames = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def mark(frame, stage):
+    if not enabled:
+        return
+    now = time.perf_counter()
+    with _lock:
+        record = _frames.get(frame)
+        if record is None:
+            record = _frames[frame] = {}
+            if len(_frames) > maxFrames:
+                _frames.popitem(last=False)
+        record[stage] = now
+
+
+def drop(frame):
+    global droppedFrames
+    if not enabled:
+        return
+    droppedFrames += 1
+    mark(frame, "dropped")
+
+
+def records():
+    with _lock:
+        return {frame: dict(record) for frame, record in _frames.items()}
+
+
+def summary():
+    # span latencies over the completed frames, plus the drop count
+    frames = records()
+    result = {"frames": len(frames), "dropped": droppedFrames, "spans": {}}
+    complete = [record for record in frames.values() if all(stage in record for stage in stages)]
+    for span, start, end in zip(spans + ["total"], stages[:-1] + [stages[0]], stages[1:] + [stages[-1]]):
+        ms = np.array([(record[end] - record[start]) * 1000 for record in complete])
+        if len(ms):
+            result["spans"][span] = {
+                "mean": float(ms.mean()),
+                "p50": float(np.percentile(ms, 50)),
+                "p95": float(np.percentile(ms, 95)),
+                "max": float(ms.max()),
+            }
+    return result
+
+
+def export_chrome(path):
+    # Chrome trace-event JSON (chrome://tracing, Perfetto), one row per span, drops as instant events
+    frames = records()
+    if not frames:
+        return
+    t0 = min(min(record.values()) for record in frames.values())
+    events = []
+    for row, span in enumerate(spans):
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": row, "args": {"name": span}})
+    for frame, record in frames.items():
+        for row, (span, start, end) in enumerate(zip(spans, stages[:-1], stages[1:])):
+            if start in record and end in record:
+                events.append(
+                    {
+                        "name": span,
+                        "ph": "X",
+                        "pid": 1,
+                        "tid": row,
+                        "ts": (record[start] - t0) * 1e6,
+                        "dur": (record[end] - record[start]) * 1e6,
+                        "args": {"frame": frame},
+                    }
+                )
+        if "dropped" in record:
+            events.append(
+                {
+                    "name": "dropped",
+                    "ph": "i",
+                    "s": "g",
+                    "pid": 1,
+                    "tid": spans.index("queueWait"),
+                    "ts": (record["dropped"] - t0) * 1e6,
+                    "args": {"frame": frame},
+                }
+            )
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def reset():
+    global droppedFrames
+    with _lock:
+        _frames.clear()
+        droppedFrames = 0
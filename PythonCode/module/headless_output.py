@@ -0,0 +1,69 @@
+import os
+import struct
+from multiprocessing import shared_memory
+
+import cv2 as cv
+import numpy as np
+
+# Sinks for the composited top-down frames of the headless SVM.
+# PngWriter        : <dir>/frame_000000.png, ...
+# SharedMemoryRing : header (frames written, width, height, slots) followed by `slots` BGRA frames,
+#                    frame k goes to slot k % slots, readers attach by name and take the latest frame
+
+headerFormat = "<QIII"
+headerSize = struct.calcsize(headerFormat)
+
+
+class PngWriter:
+    def __init__(self, directory):
+        self.directory = directory
+        self.frames = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, frame):
+        cv.imwrite(os.path.join(self.directory, "frame_{:06d}.png".format(self.frames)), frame)
+        self.frames += 1
+
+    def close(self):
+        pass
+
+
+class SharedMemoryRing:
+    def __init__(self, name, width, height, slots=4, create=True):
+        frameBytes = width * height * 4
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=headerSize + slots * frameBytes)
+            struct.pack_into(headerFormat, self.shm.buf, 0, 0, width, height, slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            _, width, height, slots = struct.unpack_from(headerFormat, self.shm.buf, 0)
+        self.owner = create
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.frames = np.ndarray((slots, height, width, 4), dtype=np.uint8, buffer=self.shm.buf, offset=headerSize)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(name, 0, 0, create=False)
+
+    def framesWritten(self):
+        return struct.unpack_from("<Q", self.shm.buf, 0)[0]
+
+    def write(self, frame):
+        k = self.framesWritten()
+        self.frames[k % self.slots] = frame
+        # the counter is bumped after the copy so readers never see a half written slot as the latest
+        struct.pack_into("<Q", self.shm.buf, 0, k + 1)
+
+    def latest(self):
+        k = self.framesWritten()
+        if k == 0:
+            return None
+        return self.frames[(k - 1) % self.slots].copy()
+
+    def close(self):
+        del self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,122 @@
+import collections
+import json
+import threading
+import time
+
+import numpy as np
+
+# Named timers and counters for the viewer hot paths.
+#   with instrumentation.timer("PacketProcessing"):
+#       ...
+#   instrumentation.count("ReceiveData.datagrams")
+# Timers keep the last `window` durations per name (rolling histogram), counters keep running totals.
+# While disabled, timer() returns a shared no-op context and count() returns right away.
+
+enabled = False
+window = 1000
+
+_timings = {}
+_counters = collections.Counter()
+_lock = threading.Lock()
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_nullTimer = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("samples", "start")
+
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.start)
+        return False
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def timer(name):
+    if not enabled:
+        return _nullTimer
+    samples = _timings.get(name)
+    if samples is None:
+        with _lock:
+            samples = _timings.setdefault(name, collections.deque(maxlen=window))
+    return _Timer(samples)
+
+
+def count(name, n=1):
+    # called from the receiver thread, the undistort pool and the render task, += on the Counter is not atomic
+    if enabled:
+        with _lock:
+            _counters[name] += n
+
+
+def snapshot():
+    with _lock:
+        timings = {name: list(samples) for name, samples in _timings.items()}
+        counters = dict(_counters)
+    stats = {"timers": {}, "counters": counters}
+    for name, samples in sorted(timings.items()):
+        if not samples:
+            continue
+        ms = np.array(samples) * 1000
+        stats["timers"][name] = {
+            "count": len(ms),
+            "mean": float(ms.mean()),
+            "p50": float(np.percentile(ms, 50)),
+            "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99)),
+            "max": float(ms.max()),
+        }
+    return stats
+
+
+def dump(path=None):
+    # prints a table, or appends one JSON line to path
+    stats = snapshot()
+    if path is not None:
+        stats["time"] = time.time()
+        with open(path, "a") as f:
+            f.write(json.dumps(stats) + "\n")
+        return
+
+    print("| timer | n | mean ms | p50 ms | p95 ms | p99 ms | max ms |")
+    print("|-------|---|---------|--------|--------|--------|--------|")
+    for name, t in stats["timers"].items():
+        print("| {} | {count} | {mean:.2f} | {p50:.2f} | {p95:.2f} | {p99:.2f} | {max:.2f} |".format(name, **t))
+    for name, value in sorted(stats["counters"].items()):
+        print("{} : {}".format(name, value))
+
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+def start_periodic_dump(path, interval=10.0):
+    def run():
+        while True:
+            time.sleep(interval)
+            dump(path)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,70 @@
+import cv2 as cv
+import numpy as np
+
+
+class TemporalLabelGate:
+    # Change-detection gate in front of a segmentation function.
+    # labelFn maps a (N, H, W, C) uint8 camera stack to (N, H, W) labels
+    # (e.g. semantic_label_generator.get_semantic_labels).
+    # Each camera is compared with a downsampled grayscale signature of the frame its cached labels were computed from,
+    # only cameras whose mean absolute difference exceeds threshold (0..255) or whose labels are older than
+    # maxStaleness frames are re-segmented.
+    def __init__(self, labelFn, threshold=2.0, maxStaleness=30, signatureSize=(64, 36)):
+        self.labelFn = labelFn
+        self.threshold = threshold
+        self.maxStaleness = maxStaleness
+        self.signatureSize = signatureSize
+
+        self.labels = None
+        self.signatures = None
+        self.ages = None
+
+        self.hits = 0
+        self.misses = 0
+        self.staleRefreshes = 0
+
+    def signature(self, image):
+        small = cv.resize(image, self.signatureSize, interpolation=cv.INTER_AREA)
+        if small.ndim == 3:
+            small = cv.cvtColor(small, cv.COLOR_BGRA2GRAY if small.shape[2] == 4 else cv.COLOR_BGR2GRAY)
+        return small.astype(np.float32)
+
+    def reset(self):
+        self.labels = None
+        self.signatures = None
+        self.ages = None
+
+    def __call__(self, images):
+        signatures = np.stack([self.signature(image) for image in images])
+
+        if self.labels is None or self.labels.shape != images.shape[:3]:
+            self.labels = np.asarray(self.labelFn(images))
+            self.signatures = signatures
+            self.ages = np.zeros(len(images), dtype=np.int64)
+            self.misses += len(images)
+            return self.labels
+
+        diff = np.abs(signatures - self.signatures).mean(axis=(1, 2))
+        changed = diff > self.threshold
+        stale = ~changed & (self.ages >= self.maxStaleness)
+        refresh = changed | stale
+
+        self.hits += int(np.count_nonzero(~refresh))
+        self.misses += int(np.count_nonzero(changed))
+        self.staleRefreshes += int(np.count_nonzero(stale))
+        self.ages += 1
+
+        if np.any(refresh):
+            self.labels[refresh] = self.labelFn(images[refresh])
+            self.signatures[refresh] = signatures[refresh]
+            self.ages[refresh] = 0
+        return self.labels
+
+    def stats(self):
+        total = self.hits + self.misses + self.staleRefreshes
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "staleRefreshes": self.staleRefreshes,
+            "hitRate": self.hits / total if total > 0 else 0.0,
+        }
@@ -0,0 +1,65 @@
+import numpy as np
+
+# Label sources feeding semanticTexArray. Every source returns a (4, H, W) uint32 array (or None when no new labels
+# are available yet, the SVM keeps the previous ones) from the camera stack and the decoded ground truth of a frame.
+# decodesGroundTruth tells UDP_ReceiverSingle.ReceiveData whether the semantic images of the RGB block are needed.
+
+
+class GroundTruthLabels:
+    # semantic images rendered by Unreal, no inference
+    decodesGroundTruth = True
+
+    def labels(self, frameId, imgs, segRaw):
+        return np.array(segRaw).astype(np.uint32)
+
+    def metrics(self):
+        return {}
+
+
+class ModelLabels:
+    # PIDNet in the render process (blocking), optionally behind the temporal reuse gate
+    decodesGroundTruth = False
+
+    def __init__(self, useGate=True):
+        import semantic_label_generator
+
+        self.labelFn = semantic_label_generator.get_semantic_labels
+        self.gate = None
+        if useGate:
+            import label_cache
+
+            self.gate = label_cache.TemporalLabelGate(self.labelFn)
+            self.labelFn = self.gate
+
+    def labels(self, frameId, imgs, segRaw):
+        return np.asarray(self.labelFn(np.array(imgs))).astype(np.uint32)
+
+    def metrics(self):
+        return self.gate.stats() if self.gate is not None else {}
+
+
+class AsyncModelLabels:
+    # PIDNet in a background process, returns the most recent finished labels
+    decodesGroundTruth = False
+
+    def __init__(self, useGate=True):
+        import segmentation_worker
+
+        self.worker = segmentation_worker.SegmentationWorker(useGate).start()
+
+    def labels(self, frameId, imgs, segRaw):
+        self.worker.submit(frameId, imgs)
+        return self.worker.poll()
+
+    def metrics(self):
+        return self.worker.metrics()
+
+
+def make_label_source(name, useGate=True):
+    if name == "groundTruth":
+        return GroundTruthLabels()
+    elif name == "model":
+        return ModelLabels(useGate)
+    elif name == "modelAsync":
+        return AsyncModelLabels(useGate)
+    raise ValueError("Unknown label source : {}".format(name))
@@ -0,0 +1,75 @@
+import argparse
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+
+def export_onnx(model, onnx_path, height=1280, width=1280, opset=18):
+    # batch and spatial axes stay dynamic so one file serves every camera resolution
+    example = torch.zeros(1, 3, height, width)
+    torch.onnx.export(
+        model.eval(),
+        example,
+        onnx_path,
+        input_names=["image"],
+        output_names=["logits"],
+        dynamic_axes={
+            "image": {0: "batch", 2: "height", 3: "width"},
+            "logits": {0: "batch", 2: "height_out", 3: "width_out"},
+        },
+        opset_version=opset,
+    )
+
+
+class OnnxModel:
+    # drop-in replacement for the PyTorch model in semantic_label_generator (tensor in, logits tensor out)
+    def __init__(self, onnx_path, intra_op_threads=4):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.inputName = self.session.get_inputs()[0].name
+
+    def __call__(self, image):
+        if isinstance(image, torch.Tensor):
+            image = image.numpy()
+        logits = self.session.run(None, {self.inputName: np.ascontiguousarray(image, dtype=np.float32)})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+
+if __name__ == "__main__":
+    # exports the float model configured in semantic_label_generator and checks ONNX Runtime against PyTorch
+    import pidnet
+    import semantic_label_generator
+
+    parser = argparse.ArgumentParser(description="Export PIDNet to ONNX and check parity with PyTorch")
+    parser.add_argument("--output", default=semantic_label_generator.onnx_pretrained)
+    parser.add_argument("--threads", type=int, default=semantic_label_generator.onnx_intra_op_threads)
+    parser.add_argument("--rtol", type=float, default=1e-3, help="max abs diff relative to the logit range")
+    args = parser.parse_args()
+
+    model = pidnet.get_pred_model(semantic_label_generator.name, semantic_label_generator.num_classes)
+    model = semantic_label_generator.load_pretrained(model, semantic_label_generator.pretrained).cpu()
+    model.eval()
+
+    export_onnx(model, args.output)
+    print("Saved {}".format(args.output))
+
+    onnxModel = OnnxModel(args.output, args.threads)
+    for shape in [(1, 3, 720, 1280), (2, 3, 512, 512)]:
+        image = torch.randn(*shape)
+        with torch.no_grad():
+            ref = model(image)
+        out = onnxModel(image)
+        maxDiff = (ref - out).abs().max().item()
+        relDiff = maxDiff / max(ref.abs().max().item(), 1e-6)
+        agreement = (ref.argmax(1) == out.argmax(1)).float().mean().item()
+        print(
+            "{} : max abs diff {:.2e} (rel {:.2e}), label agreement {:.4%}".format(shape, maxDiff, relDiff, agreement)
+        )
+        assert tuple(ref.shape) == tuple(out.shape)
+        assert relDiff < args.rtol
@@ -0,0 +1,93 @@
+import argparse
+import copy
+
+import numpy as np
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+import seg_eval
+
+# fbgemm targets x86 CPUs, use qnnpack on ARM hosts
+backend = "fbgemm"
+
+
+def prepare_pidnet(model, example):
+    # FX graph mode handles the residual adds and conv/bn fusion of PIDNet without touching model_utils
+    torch.backends.quantized.engine = backend
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    return prepare_fx(copy.deepcopy(model).eval(), qconfig_mapping, (example,))
+
+
+def quantize_pidnet(model, calib_batches):
+    # static post-training quantization, calib_batches are preprocessed (1, 3, H, W) float tensors
+    prepared = prepare_pidnet(model, calib_batches[0])
+    with torch.no_grad():
+        for batch in calib_batches:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def load_quantized(model, quantized_pretrained):
+    # rebuild the int8 graph from the float model and restore the calibrated scales/zero points
+    example = torch.zeros(1, 3, 256, 256)
+    quantized = convert_fx(prepare_pidnet(model, example))
+    quantized.load_state_dict(torch.load(quantized_pretrained, map_location="cpu"))
+    quantized.eval()
+    return quantized
+
+
+def predict(model, batch):
+    with torch.no_grad():
+        pred = model(batch)
+        pred = torch.nn.functional.interpolate(pred, size=batch.size()[-2:], mode="bilinear", align_corners=True)
+        return torch.argmax(pred, dim=1).squeeze(0).numpy()
+
+
+if __name__ == "__main__":
+    # Run with precision = "float" in semantic_label_generator, the float model is the calibration source.
+    import pidnet
+    import semantic_label_generator
+
+    parser = argparse.ArgumentParser(description="int8 post-training quantization of PIDNet")
+    parser.add_argument("--calib-dir", required=True, help="recorded camera frames used for calibration")
+    parser.add_argument("--calib-count", type=int, default=64)
+    parser.add_argument("--eval-dir", help="held-out camera frames")
+    parser.add_argument("--label-dir", help="labels of the held-out frames (same file names)")
+    parser.add_argument("--output", default=semantic_label_generator.quantized_pretrained)
+    args = parser.parse_args()
+
+    def to_batch(image):
+        image = semantic_label_generator.input_transform(image)
+        image = image.transpose((2, 0, 1)).copy()
+        return torch.from_numpy(image).unsqueeze(0)
+
+    model = pidnet.get_pred_model(semantic_label_generator.name, semantic_label_generator.num_classes)
+    model = semantic_label_generator.load_pretrained(model, semantic_label_generator.pretrained).cpu()
+    model.eval()
+
+    frames, _ = seg_eval.load_frames(args.calib_dir, limit=args.calib_count)
+    print("Calibrating with {} frames".format(len(frames)))
+    quantized = quantize_pidnet(model, [to_batch(frame) for frame in frames])
+    torch.save(quantized.state_dict(), args.output)
+    print("Saved {}".format(args.output))
+
+    num_classes = semantic_label_generator.num_classes
+    if args.eval_dir and args.label_dir:
+        frames, paths = seg_eval.load_frames(args.eval_dir)
+        labels = seg_eval.load_labels(args.label_dir, paths)
+        conf_float = np.zeros((num_classes, num_classes), dtype=np.int64)
+        conf_int8 = np.zeros((num_classes, num_classes), dtype=np.int64)
+        for frame, label in zip(frames, labels):
+            batch = to_batch(frame)
+            conf_float += seg_eval.confusion_matrix(predict(model, batch), label, num_classes)
+            conf_int8 += seg_eval.confusion_matrix(predict(quantized, batch), label, num_classes)
+        miou_float = seg_eval.mean_iou(conf_float)
+        miou_int8 = seg_eval.mean_iou(conf_int8)
+        print("mIoU float : {:.4f}".format(miou_float))
+        print("mIoU int8  : {:.4f}".format(miou_int8))
+        print("mIoU delta : {:+.4f}".format(miou_int8 - miou_float))
+
+    batch = torch.randn(1, 3, 1280, 1280)
+    print("Latency float (1280x1280) : {:.1f} ms".format(seg_eval.time_call(predict, model, batch, repeat=5)))
+    print("Latency int8  (1280x1280) : {:.1f} ms".format(seg_eval.time_call(predict, quantized, batch, repeat=5)))
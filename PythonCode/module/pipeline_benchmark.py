@@ -0,0 +1,219 @@
+import argparse
+import json
+import subprocess
+import time
+import types
+
+import cv2 as cv
+import numpy as np
+import panda3d.core as p3d
+
+import label_source
+import SVM_thread
+import UDP_ReceiverSingle
+from frame_recorder import FrameLog
+from frame_replay import packetize
+from synthetic_frames import SyntheticFrames
+
+# Per-stage latency of the receive -> SVM pipeline on recorded or synthetic frames, without a window.
+# Every frame runs through the stages in order and each stage is timed on its own, "endToEnd" covers all of them.
+# The GPU passes are not run: the blending weights are computed on a synthetic texGeoInfo0 and the inpainting on the
+# camera mosaic with a hole where the boat is.
+
+stageNames = [
+    "reassembly",
+    "headerParse",
+    "depthUnprojection",
+    "imageDecode",
+    "colorization",
+    "labels",
+    "pointUpload",
+    "textureUpload",
+    "blendingWeights",
+    "inpainting",
+]
+
+
+def reassemble(datagrams, packetNum):
+    # the packetDict bookkeeping of ReceiveData
+    packetDict = {}
+    fullPackets = None
+    for packet in datagrams:
+        frame = int.from_bytes(packet[0:4], "little")
+        count = int.from_bytes(packet[4:8], "little")
+        if frame not in packetDict:
+            packetDict[frame] = {}
+        packetDict[frame][count] = packet[8:]
+        if len(packetDict[frame]) == packetNum:
+            fullPackets = b"".join([packetDict[frame][i] for i in range(packetNum)])
+            del packetDict[frame]
+    return fullPackets
+
+
+def synthetic_geo_info(width, height, numClasses=19, seed=0):
+    # texGeoInfo0 layout : (overlapIndex1, overlapIndex0, semantic * 100 + camId0 * 10 + camId1, count)
+    # cameras F, R, B, L cover 90 degree sectors around the boat, the sector borders +-10 degrees overlap
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    angle = (np.degrees(np.arctan2(x - width / 2, height / 2 - y)) + 45) % 360
+    cam0 = (angle // 90).astype(np.uint32)
+    border = angle % 90
+    overlap = (border < 10) | (border > 80)
+    cam1 = np.where(border < 10, (cam0 + 3) % 4, (cam0 + 1) % 4).astype(np.uint32)
+    semantic = rng.integers(0, numClasses, (height // 32 + 1, width // 32 + 1)).repeat(32, 0).repeat(32, 1)
+    semantic = semantic[:height, :width].astype(np.uint32)
+
+    geoInfo = np.zeros((height, width, 4), dtype=np.uint32)
+    geoInfo[..., 0] = np.where(overlap, cam1, 255)
+    geoInfo[..., 1] = np.where(overlap, cam0, 255)
+    geoInfo[..., 2] = semantic * 100 + cam0 * 10 + np.where(overlap, cam1, cam0)
+    geoInfo[..., 3] = np.where(overlap, 2, 1)
+    return geoInfo
+
+
+def composite_with_holes(imgs, width, height):
+    # 2x2 camera mosaic with the unseen area under the boat left black
+    top = np.concatenate(imgs[0:2], axis=1)
+    bottom = np.concatenate(imgs[2:4], axis=1)
+    image = np.ascontiguousarray(np.concatenate([top, bottom], axis=0))
+    image = cv.resize(image, (width, height))
+    cv.ellipse(image, (width // 2, height // 2), (width // 12, height // 6), 0, 0, 360, (0, 0, 0, 255), -1)
+    return image
+
+
+def frame_source(args):
+    # yields (frame, initPacket, payload)
+    if args.log is not None:
+        log = FrameLog(args.log)
+        for k in range(args.frames):
+            frame, _, initPacket, payload = log.read(k % len(log))
+            yield frame, initPacket, payload
+        log.close()
+    else:
+        lidarRes, lidarChs = [int(v) for v in args.lidar.split("x")]
+        width, height = [int(v) for v in args.image.split("x")]
+        gen = SyntheticFrames(lidarRes, lidarChs, width, height)
+        for k in range(args.frames):
+            payload = gen.frame(k).tobytes()
+            yield k, gen.initPacket(-(-len(payload) // args.datagram_bytes)), payload
+
+
+def summarize(samples):
+    samples = np.array(samples) * 1000
+    return {
+        "p50": float(np.percentile(samples, 50)),
+        "p95": float(np.percentile(samples, 95)),
+        "p99": float(np.percentile(samples, 99)),
+        "mean": float(samples.mean()),
+        "fps": float(1000 / samples.mean()) if samples.mean() > 0 else 0.0,
+    }
+
+
+def run(args):
+    timings = {name: [] for name in stageNames + ["endToEnd"]}
+    labels = label_source.GroundTruthLabels()
+    base = None
+    geoInfo = synthetic_geo_info(args.view, args.view)
+
+    for k, (frame, initPacket, payload) in enumerate(frame_source(args)):
+        stamps = [time.perf_counter()]
+
+        def lap(name):
+            stamps.append(time.perf_counter())
+            if k >= args.warmup:
+                timings[name].append(stamps[-1] - stamps[-2])
+
+        datagrams = packetize(frame, payload, args.datagram_bytes)
+        stamps[0] = time.perf_counter()
+        fullPackets = bytearray(reassemble(datagrams, len(datagrams)))
+        lap("reassembly")
+
+        packetInit = {}
+        UDP_ReceiverSingle.ParseInitPacket(initPacket, packetInit)
+        lap("headerParse")
+
+        worldpointList = UDP_ReceiverSingle.DecodeDepth(packetInit, fullPackets)
+        lap("depthUnprojection")
+
+        imgs, segBgra = UDP_ReceiverSingle.DecodeImages(packetInit, fullPackets)
+        lap("imageDecode")
+
+        segs = [UDP_ReceiverSingle.ColorizeSemantics(segnp) for segnp in segBgra]
+        segRaw = [cv.cvtColor(segnp, cv.COLOR_BGRA2GRAY) for segnp in segBgra]
+        lap("colorization")
+
+        segRaw = labels.labels(frame, imgs, segRaw)
+        lap("labels")
+
+        if base is None:
+            # the resources InitSVM sets up, without a window
+            base = types.SimpleNamespace(
+                lidarRes=packetInit["lidarRes"],
+                lidarChs=packetInit["lidarChs"],
+                numLidars=packetInit["numLidars"],
+                renderObj=p3d.NodePath("benchmark"),
+                isPointCloudVisible=True,
+                planeTexArray=p3d.Texture(),
+                semanticTexArray=p3d.Texture(),
+            )
+            SVM_thread.GeneratePointNode(base)
+            width, height = packetInit["imageWidth"], packetInit["imageHeight"]
+            base.planeTexArray.setup2dTextureArray(width, height, 4, p3d.Texture.T_unsigned_byte, p3d.Texture.F_rgba)
+            base.semanticTexArray.setup2dTextureArray(width, height, 4, p3d.Texture.T_int, p3d.Texture.F_r32i)
+            stamps[-1] = time.perf_counter()
+
+        SVM_thread.UploadPoints(base, worldpointList)
+        lap("pointUpload")
+
+        SVM_thread.UploadTextures(base, packetInit["imageWidth"], packetInit["imageHeight"], imgs, segRaw)
+        lap("textureUpload")
+
+        SVM_thread.ComputeBlendingWeights(geoInfo)
+        lap("blendingWeights")
+
+        composite = composite_with_holes(imgs, args.view, args.view)
+        stamps[-1] = time.perf_counter()
+        SVM_thread.InpaintHoles(composite)
+        lap("inpainting")
+
+        if k >= args.warmup:
+            timings["endToEnd"].append(sum(timings[name][-1] for name in stageNames))
+
+    return {name: summarize(samples) for name, samples in timings.items() if samples}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage latency of the receive -> SVM pipeline")
+    parser.add_argument("--log", default=None, help="frame log (frame_recorder.py), default: synthetic frames")
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--image", default="512x512", help="synthetic camera resolution")
+    parser.add_argument("--lidar", default="1024x32", help="synthetic lidar resolution x channels")
+    parser.add_argument("--view", type=int, default=SVM_thread.winSizeX, help="SVM render target size")
+    parser.add_argument("--datagram-bytes", type=int, default=50000)
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    stages = run(args)
+    result = {
+        "commit": git_commit(),
+        "source": args.log or "synthetic",
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "stages": stages,
+    }
+
+    print("| stage | p50 ms | p95 ms | p99 ms | fps |")
+    print("|-------|--------|--------|--------|-----|")
+    for name, stats in stages.items():
+        print("| {} | {p50:.2f} | {p95:.2f} | {p99:.2f} | {fps:.1f} |".format(name, **stats))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=4)
@@ -0,0 +1,46 @@
+import glob
+import os
+import time
+
+import cv2 as cv
+import numpy as np
+
+
+def load_frames(image_dir, pattern="*.png", limit=None):
+    # recorded camera frames (BGR, as read by cv.imread) sorted by file name
+    paths = sorted(glob.glob(os.path.join(image_dir, pattern)))
+    if limit is not None:
+        paths = paths[:limit]
+    return [cv.imread(path, cv.IMREAD_COLOR) for path in paths], paths
+
+
+def load_labels(label_dir, paths):
+    # label images share the base name of the frame they belong to (H x W uint8 class ids)
+    labels = []
+    for path in paths:
+        label_path = os.path.join(label_dir, os.path.basename(path))
+        labels.append(cv.imread(label_path, cv.IMREAD_GRAYSCALE))
+    return labels
+
+
+def confusion_matrix(pred, label, num_classes, ignore_label=255):
+    valid = label != ignore_label
+    index = label[valid].astype(np.int64) * num_classes + pred[valid].astype(np.int64)
+    return np.bincount(index, minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+
+def mean_iou(confusion):
+    tp = np.diag(confusion).astype(np.float64)
+    union = confusion.sum(0) + confusion.sum(1) - tp
+    iou = tp[union > 0] / union[union > 0]
+    return iou.mean() if len(iou) > 0 else 0.0
+
+
+def time_call(fn, *args, warmup=2, repeat=10):
+    # returns the mean latency of fn(*args) in milliseconds
+    for _ in range(warmup):
+        fn(*args)
+    t_start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - t_start) / repeat * 1000
@@ -0,0 +1,47 @@
+import argparse
+import time
+
+import numpy as np
+
+import seg_eval
+import semantic_label_generator
+
+# latency/accuracy trade-off of semantic_label_generator.infer_scale on recorded frames
+# accuracy is mIoU against the labels when --label-dir is given, otherwise agreement with the full-resolution labels
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency/accuracy table for downscale-infer-upscale segmentation")
+    parser.add_argument("--image-dir", required=True, help="recorded camera frames")
+    parser.add_argument("--label-dir", help="ground-truth labels (same file names)")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.75, 0.5, 0.25])
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    num_classes = semantic_label_generator.num_classes
+    frames, paths = seg_eval.load_frames(args.image_dir, limit=args.limit)
+    if args.label_dir:
+        references = seg_eval.load_labels(args.label_dir, paths)
+    else:
+        references = [semantic_label_generator.get_semantic_label(frame, 1.0) for frame in frames]
+
+    print("| scale | resolution | ms / frame | {} |".format("mIoU" if args.label_dir else "agreement"))
+    print("|-------|------------|------------|------|")
+    for scale in args.scales:
+        latency = 0.0
+        confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        agreement = 0.0
+        semantic_label_generator.get_semantic_label(frames[0], scale)  # warm-up
+        for frame, reference in zip(frames, references):
+            t_start = time.perf_counter()
+            pred = semantic_label_generator.get_semantic_label(frame, scale)
+            latency += (time.perf_counter() - t_start) * 1000
+            confusion += seg_eval.confusion_matrix(pred, reference, num_classes)
+            agreement += np.mean(pred == reference)
+
+        height, width = frames[0].shape[:2]
+        accuracy = seg_eval.mean_iou(confusion) if args.label_dir else agreement / len(frames)
+        print(
+            "| {:.2f} | {}x{} | {:.1f} | {:.4f} |".format(
+                scale, int(width * scale), int(height * scale), latency / len(frames), accuracy
+            )
+        )
@@ -0,0 +1,143 @@
+import collections
+import multiprocessing as mp
+import queue
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# The camera stacks go through one shared memory slot instead of the queue: header (frame id, submit time) followed by
+# the (4, H, W, 4) uint8 stack. submit() overwrites it (latest wins) and only queues (frameId, slot name, shape), the
+# worker copies the slot out under the lock. A new slot is created when the stack shape changes.
+
+headerFormat = "<qd"
+headerSize = struct.calcsize(headerFormat)
+
+
+def _runWorker(inQueue, outQueue, slotLock, useGate):
+    # runs in the child process, the model is loaded here so the render process never imports it
+    import semantic_label_generator
+
+    labelFn = semantic_label_generator.get_semantic_labels
+    if useGate:
+        import label_cache
+
+        labelFn = label_cache.TemporalLabelGate(labelFn)
+
+    slot = None
+    while True:
+        item = inQueue.get()
+        if item is None:
+            break
+        _, name, shape = item
+        if slot is None or slot.name != name:
+            try:
+                newSlot = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                # replaced by a slot of another shape before this request was read, its own request follows
+                continue
+            if slot is not None:
+                slot.close()
+            slot = newSlot
+
+        with slotLock:
+            # the slot may hold a newer frame than the request, take whatever is latest
+            frameId, submitTime = struct.unpack_from(headerFormat, slot.buf, 0)
+            images = np.ndarray(shape, dtype=np.uint8, buffer=slot.buf, offset=headerSize).copy()
+        startTime = time.monotonic()
+        labels = np.asarray(labelFn(images)).astype(np.uint32)
+        outQueue.put((frameId, submitTime, startTime, time.monotonic(), labels))
+
+    if slot is not None:
+        slot.close()
+
+
+class SegmentationWorker:
+    # Background PIDNet inference decoupled from the Panda3D task loop.
+    # submit() hands over the latest (4, H, W, 4) camera stack (older pending stacks are dropped),
+    # poll() returns the most recent finished (4, H, W) uint32 labels or None.
+    def __init__(self, useGate=True, historySize=100):
+        ctx = mp.get_context("spawn")
+        self.inQueue = ctx.Queue(maxsize=1)
+        self.outQueue = ctx.Queue()
+        self.slotLock = ctx.Lock()
+        self.slot = None
+        self.frames = None
+        self.process = ctx.Process(
+            target=_runWorker, args=(self.inQueue, self.outQueue, self.slotLock, useGate), daemon=True
+        )
+
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.lastFrameId = None
+        self.labelLatency = collections.deque(maxlen=historySize)
+        self.inferTime = collections.deque(maxlen=historySize)
+
+    def start(self):
+        self.process.start()
+        return self
+
+    def stop(self):
+        if self.process.is_alive():
+            self.inQueue.put(None)
+            self.process.join(timeout=5)
+        self._releaseSlot()
+
+    def _releaseSlot(self):
+        if self.slot is not None:
+            self.frames = None
+            self.slot.close()
+            self.slot.unlink()
+            self.slot = None
+
+    def submit(self, frameId, images):
+        # images : the four camera images, a list or one (4, H, W, 4) uint8 array
+        shape = (len(images),) + tuple(images[0].shape)
+        if self.frames is None or self.frames.shape != shape:
+            self._releaseSlot()
+            self.slot = shared_memory.SharedMemory(create=True, size=headerSize + int(np.prod(shape)))
+            self.frames = np.ndarray(shape, dtype=np.uint8, buffer=self.slot.buf, offset=headerSize)
+
+        with self.slotLock:
+            for frame, image in zip(self.frames, images):
+                frame[...] = image
+            struct.pack_into(headerFormat, self.slot.buf, 0, frameId, time.monotonic())
+
+        try:
+            self.inQueue.get_nowait()
+            self.dropped += 1
+        except queue.Empty:
+            pass
+        self.inQueue.put((frameId, self.slot.name, shape))
+        self.submitted += 1
+
+    def poll(self):
+        latest = None
+        while True:
+            try:
+                frameId, submitTime, startTime, endTime, labels = self.outQueue.get_nowait()
+            except queue.Empty:
+                break
+            self.completed += 1
+            self.lastFrameId = frameId
+            self.labelLatency.append((time.monotonic() - submitTime) * 1000)
+            self.inferTime.append((endTime - startTime) * 1000)
+            latest = labels
+        return latest
+
+    def metrics(self):
+        def summary(values):
+            if len(values) == 0:
+                return {"mean": 0.0, "p95": 0.0}
+            return {"mean": float(np.mean(values)), "p95": float(np.percentile(values, 95))}
+
+        return {
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "lastFrameId": self.lastFrameId,
+            "latencyToLabelMs": summary(self.labelLatency),
+            "inferMs": summary(self.inferTime),
+        }
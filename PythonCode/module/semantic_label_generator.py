@@ -1,5 +1,7 @@
+import cv2 as cv
 import numpy as np
 import pidnet
+import pidnet_quant
 import torch
 import torch.nn.functional as F
 
@@ -15,6 +17,29 @@ def input_transform(image):
     return image
 
 
+class InputTransform:
+    # fused input_transform: (N, H, W, 3|4) BGR(A) uint8 -> normalized RGB NCHW float32 in a single pass per channel
+    # the output tensor is reused across frames (pinned when CUDA is available), alpha is never read
+    def __init__(self):
+        self.scale = [1.0 / (255.0 * s) for s in std]
+        self.shift = [torch.tensor(-m / s) for m, s in zip(mean, std)]
+        self.buffer = None
+
+    def __call__(self, images):
+        n, h, w = images.shape[:3]
+        if self.buffer is None or tuple(self.buffer.shape) != (n, 3, h, w):
+            self.buffer = torch.empty((n, 3, h, w), dtype=torch.float32)
+            if torch.cuda.is_available():
+                self.buffer = self.buffer.pin_memory()
+
+        src = torch.from_numpy(images)
+        for c in range(3):
+            # RGB channel c is BGR(A) channel 2 - c, x * scale + shift (shift = -mean / std) converts and normalizes
+            # at once
+            torch.add(self.shift[c], src[..., 2 - c], alpha=self.scale[c], out=self.buffer[:, c])
+        return self.buffer
+
+
 def load_pretrained(model, pretrained):
     pretrained_dict = torch.load(pretrained, map_location="cpu")
     if "state_dict" in pretrained_dict:
@@ -36,19 +61,60 @@ def load_pretrained(model, pretrained):
 name = "pidnet-l"
 num_classes = 5
 pretrained = "../pretrained_model/pidnet/pidnet_large_boatsim.pt"
+# "float" : fp32 PIDNet
+# "int8" : statically quantized PIDNet for CPU-only hosts (create the checkpoint with pidnet_quant.py)
+precision = "float"
+quantized_pretrained = "../pretrained_model/pidnet/pidnet_large_boatsim_int8.pt"
+# "torch" : PyTorch model above
+# "onnx" : ONNX Runtime CPU provider (create the model with pidnet_onnx.py), skips building the PyTorch model
+backend = "torch"
+onnx_pretrained = "../pretrained_model/pidnet/pidnet_large_boatsim.onnx"
+onnx_intra_op_threads = 4
+# internal inference resolution relative to the camera image (see segmentation_scale_table.py)
+# 1.0 keeps the full-resolution path, below 1.0 only the argmax labels are upsampled (nearest)
+infer_scale = 1.0
+
+if backend == "onnx":
+    import pidnet_onnx
+
+    model = pidnet_onnx.OnnxModel(onnx_pretrained, onnx_intra_op_threads)
+else:
+    model = pidnet.get_pred_model(name, num_classes)
+    # model = load_pretrained(model, pretrained).cuda()
+    model = load_pretrained(model, pretrained).cpu()
+    model.eval()
+    if precision == "int8":
+        model = pidnet_quant.load_quantized(model, quantized_pretrained)
 
-model = pidnet.get_pred_model(name, num_classes)
-# model = load_pretrained(model, pretrained).cuda()
-model = load_pretrained(model, pretrained).cpu()
-model.eval()
 
+preprocess = InputTransform()
 
-def get_semantic_label(image):
-    image = input_transform(image)
-    image = image.transpose((2, 0, 1)).copy()
-    # image = torch.from_numpy(image).unsqueeze(0).cuda()
-    image = torch.from_numpy(image).unsqueeze(0).cpu()
-    pred = model(image)
-    pred = F.interpolate(pred, size=image.size()[-2:], mode="bilinear", align_corners=True)
-    pred = torch.argmax(pred, dim=1).squeeze(0).cpu().numpy()
+
+def get_semantic_labels(images, scale=None):
+    # images : (N, H, W, 3|4) BGR(A) uint8 stack, e.g. the four cameras of one frame
+    if scale is None:
+        scale = infer_scale
+    height, width = images.shape[1:3]
+    if scale != 1.0:
+        # keep the internal resolution a multiple of 8 (PIDNet output stride)
+        inferWidth = max(8, int(round(width * scale / 8)) * 8)
+        inferHeight = max(8, int(round(height * scale / 8)) * 8)
+        images = np.stack(
+            [cv.resize(image, (inferWidth, inferHeight), interpolation=cv.INTER_AREA) for image in images]
+        )
+
+    image = preprocess(images)
+    # image = image.cuda(non_blocking=True)
+    with torch.no_grad():
+        pred = model(image)
+        pred = F.interpolate(pred, size=image.size()[-2:], mode="bilinear", align_corners=True)
+        # class ids fit uint8 (num_classes < 256), the same dtype for every scale
+        pred = torch.argmax(pred, dim=1).cpu().numpy().astype(np.uint8)
+
+    if scale != 1.0:
+        pred = np.stack([cv.resize(label, (width, height), interpolation=cv.INTER_NEAREST) for label in pred])
     return pred
+
+
+def get_semantic_label(image, scale=None):
+    return get_semantic_labels(image[np.newaxis], scale)[0]
@@ -0,0 +1,139 @@
+import argparse
+import time
+
+import numpy as np
+
+# NumPy version of the svm_ps_plane.glsl pass.
+# Every world position on the water plane is projected into the four cameras with matViewProj0..3, the cameras that
+# see it are listed in overlapIndex and the camera with the highest semantic class is encoded in mapProp:
+#   mapProp = semantic * 100 + camera * 10 + 7, or semantic * 100 + camera * 10 + 1 when a later camera ties.
+# geo_info() returns texGeoInfo0 as read back into RAM by readTextureData: (H, W, 4) uint32 in Panda3D's BGRA
+# order, i.e. (overlapIndex[1], overlapIndex[0], mapProp, count), -1 stored as 0xFFFFFFFF, bottom row first.
+
+undefined = np.uint32(0xFFFFFFFF)
+
+
+def view_positions(width, height, fov=60, camHeight=3000, z=0):
+    # water plane positions under the pixels of the top-down SVM camera (SurroundView.cam at (0, 0, camHeight) looking
+    # down, +X right, +Y up), bottom row first like the render target in RAM
+    tanHalf = np.tan(np.radians(fov) / 2) * camHeight
+    x = ((np.arange(width) + 0.5) / width * 2 - 1) * tanHalf
+    y = ((np.arange(height) + 0.5) / height * 2 - 1) * tanHalf * height / width
+    positions = np.empty((height, width, 3), dtype=np.float32)
+    positions[..., 0] = x[None, :]
+    positions[..., 1] = y[:, None]
+    positions[..., 2] = z
+    return positions
+
+
+def project(positions, matViewProjs):
+    # -> texPos (4, H, W, 2) in [0, 1] texture space and visible (4, H, W)
+    # Panda3D matrices multiply row vectors, the shader's matViewProj * pos is pos @ mat here
+    homogeneous = np.concatenate([positions, np.ones(positions.shape[:-1] + (1,), dtype=positions.dtype)], axis=-1)
+    texPos = []
+    visible = []
+    for mat in matViewProjs:
+        clip = homogeneous @ np.array(mat, dtype=np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ndc = clip[..., :3] / clip[..., 3:4]
+        tex = (ndc[..., :2] + 1.0) * 0.5
+        texPos.append(tex)
+        visible.append(
+            (ndc[..., 2] >= 0.0)
+            & (ndc[..., 2] <= 1.0)
+            & (tex[..., 0] >= 0.0)
+            & (tex[..., 0] <= 1.0)
+            & (tex[..., 1] >= 0.0)
+            & (tex[..., 1] <= 1.0)
+        )
+    return np.stack(texPos), np.stack(visible)
+
+
+def texel_index(texPos, imageWidth, imageHeight):
+    # texelFetch index of the shader, ivec2((1 - u) * w + 0.5, (1 - v) * h + 0.5)
+    # (only meaningful where the position is visible, elsewhere texPos may be nan)
+    with np.errstate(invalid="ignore"):
+        tx = ((1 - texPos[..., 0]) * imageWidth + 0.5).astype(np.int32)
+        ty = ((1 - texPos[..., 1]) * imageHeight + 0.5).astype(np.int32)
+    return tx, ty
+
+
+def geo_info(positions, matViewProjs, semantics):
+    # semantics : (4, imageHeight, imageWidth) class ids as uploaded to semanticTexArray
+    _, imageHeight, imageWidth = semantics.shape
+    texPos, visible = project(positions, matViewProjs)
+    tx, ty = texel_index(texPos, imageWidth, imageHeight)
+
+    shape = positions.shape[:-1]
+    count = np.zeros(shape, dtype=np.int32)
+    mapProp = np.zeros(shape, dtype=np.int32)
+    overlap0 = np.full(shape, -1, dtype=np.int32)
+    overlap1 = np.full(shape, -1, dtype=np.int32)
+
+    for i in range(len(matViewProjs)):
+        seen = visible[i]
+        overlap0 = np.where(seen & (count == 0), i, overlap0)
+        overlap1 = np.where(seen & (count == 1), i, overlap1)
+        count += seen
+
+        # texelFetch outside the texture reads 0 (u or v exactly 0 rounds to w or h)
+        inside = seen & (tx[i] < imageWidth) & (ty[i] < imageHeight)
+        semantic = np.zeros(shape, dtype=np.int32)
+        semantic[inside] = semantics[i, ty[i][inside], tx[i][inside]]
+
+        best = mapProp // 100
+        higher = (semantic != 0) & (semantic > best)
+        tie = (semantic != 0) & (semantic == best)
+        mapProp = np.where(higher, semantic * 100 + i * 10 + 7, mapProp)
+        mapProp = np.where(tie, mapProp // 10 * 10 + 1, mapProp)
+
+    info = np.empty(shape + (4,), dtype=np.uint32)
+    info[..., 0] = overlap1.astype(np.uint32)
+    info[..., 1] = overlap0.astype(np.uint32)
+    info[..., 2] = mapProp
+    info[..., 3] = count
+    return info
+
+
+def camera_lookup(positions, matViewProjs, imageWidth, imageHeight):
+    # per-pixel source texel of every camera, (4, H, W) x, y and visibility, as a precomputed lookup table
+    texPos, visible = project(positions, matViewProjs)
+    tx, ty = texel_index(texPos, imageWidth, imageHeight)
+    visible &= (tx < imageWidth) & (ty < imageHeight)
+    return tx, ty, visible
+
+
+if __name__ == "__main__":
+    import SVM_thread
+    import UDP_ReceiverSingle
+    from synthetic_frames import SyntheticFrames
+
+    parser = argparse.ArgumentParser(description="Time the CPU svm_ps_plane pass and the blending weights on it")
+    parser.add_argument("--view", type=int, default=SVM_thread.winSizeX, help="render target size")
+    parser.add_argument("--image", default="512x512", help="camera resolution")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    width, height = [int(v) for v in args.image.split("x")]
+    gen = SyntheticFrames(64, 8, width, height)
+    packetInit = {}
+    UDP_ReceiverSingle.ParseInitPacket(gen.initPacket(0), packetInit)
+    matViewProjs, _ = SVM_thread.ComputeViewProjs(packetInit, width, height)
+    _, segBgra = UDP_ReceiverSingle.DecodeImages(packetInit, bytearray(gen.frame(0)))
+    semantics = np.array([seg[..., 0] for seg in segBgra], dtype=np.int32)
+    positions = view_positions(args.view, args.view)
+
+    t_start = time.perf_counter()
+    for _ in range(args.repeat):
+        info = geo_info(positions, matViewProjs, semantics)
+    geoMs = (time.perf_counter() - t_start) / args.repeat * 1000
+
+    t_start = time.perf_counter()
+    for _ in range(args.repeat):
+        w = SVM_thread.ComputeBlendingWeights(info)
+    weightMs = (time.perf_counter() - t_start) / args.repeat * 1000
+
+    counts = np.bincount(info[..., 3].ravel(), minlength=5)
+    print("geo info : {:.1f} ms, blending weights : {:.1f} ms".format(geoMs, weightMs))
+    print("pixels seen by 0..4 cameras : {}".format(counts.tolist()))
+    print("w01, w12, w23, w30 : {}".format(np.round(w, 3).tolist()))
@@ -0,0 +1,212 @@
+import argparse
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+import UDP_ReceiverSingle
+from frame_replay import ReplaySender
+
+# Synthetic sensor frames in the simulator wire format, to load test the receiver and the SVM without Unreal.
+# payload : depth map float32 (lidarChs * lidarRes), then per camera the BGRA image and the BGRA semantic image
+#           (class id in B, G and R), bytesPoints is 0 as in SensorOutToBytes360
+# A few base frames are generated once and shifted per frame so the generator does not bound the measured rate.
+
+initFormat = "<" + "I" * 11 + "i" * 17
+# the init packet carries 4 camera poses and DecodeImages / the SVM take exactly 4 cameras
+numCameras = 4
+# F, R, B, L : camera pitch, location x, y, z
+defaultCameras = [(-20, 200, 0, 100), (-20, 0, 100, 100), (-20, -200, 0, 100), (-20, 0, -100, 100)]
+
+
+class SyntheticFrames:
+    def __init__(
+        self,
+        lidarRes=1024,
+        lidarChs=32,
+        imageWidth=1024,
+        imageHeight=1024,
+        numClasses=19,
+        numLidars=1,
+        fov=120,
+        isFisheye=0,
+        seed=0,
+    ):
+        self.lidarRes = lidarRes
+        self.lidarChs = lidarChs
+        self.imageWidth = imageWidth
+        self.imageHeight = imageHeight
+        self.numClasses = numClasses
+        self.numLidars = numLidars
+        self.fov = fov
+        self.isFisheye = isFisheye
+
+        rng = np.random.default_rng(seed)
+        angle = np.linspace(0, 2 * np.pi, lidarRes, endpoint=False)
+        self.depth = (1000 + 500 * np.sin(3 * angle)[None, :] + rng.normal(0, 10, (lidarChs, lidarRes))).astype(
+            np.float32
+        )
+
+        y, x = np.mgrid[0:imageHeight, 0:imageWidth]
+        self.images = []
+        self.labels = []
+        for cam in range(numCameras):
+            img = np.empty((imageHeight, imageWidth, 4), dtype=np.uint8)
+            img[..., 0] = (x * 255 // max(imageWidth - 1, 1) + 64 * cam) % 256
+            img[..., 1] = y * 255 // max(imageHeight - 1, 1)
+            img[..., 2] = rng.integers(0, 256, (imageHeight, imageWidth), dtype=np.uint8)
+            img[..., 3] = 255
+            self.images.append(img)
+            # horizontal bands of classes with a blocky border
+            blocks = rng.integers(-2, 3, (imageHeight // 32 + 1, imageWidth // 32 + 1)).repeat(32, 0).repeat(32, 1)
+            classes = ((y * numClasses // imageHeight + blocks[:imageHeight, :imageWidth]) % numClasses).astype(
+                np.uint8
+            )
+            seg = np.empty((imageHeight, imageWidth, 4), dtype=np.uint8)
+            seg[..., :3] = classes[..., None]
+            seg[..., 3] = 255
+            self.labels.append(seg)
+
+        self.bytesDepthmap = self.depth.nbytes
+        self.bytesRGBmap = numCameras * 2 * imageWidth * imageHeight * 4
+        self.frameBytes = self.bytesDepthmap + self.bytesRGBmap
+        self.payload = np.empty(self.frameBytes, dtype=np.uint8)
+
+    def initPacket(self, packetNum):
+        return struct.pack(
+            initFormat,
+            0xFFFFFFFF,
+            packetNum,
+            0,
+            self.bytesDepthmap,
+            self.bytesRGBmap,
+            self.numLidars,
+            self.lidarRes,
+            self.lidarChs,
+            self.imageWidth,
+            self.imageHeight,
+            self.fov,
+            *[camera[0] for camera in defaultCameras],
+            *[camera[1] for camera in defaultCameras],
+            *[camera[2] for camera in defaultCameras],
+            *[camera[3] for camera in defaultCameras],
+            self.isFisheye,
+        )
+
+    def frame(self, k):
+        # the returned buffer is reused by the next frame()
+        shift = (k * 8) % self.imageWidth
+        self.payload[: self.bytesDepthmap] = np.roll(self.depth, k, axis=1).view(np.uint8).ravel()
+        offset = self.bytesDepthmap
+        for img, seg in zip(self.images, self.labels):
+            for src in (img, seg):
+                dst = self.payload[offset : offset + src.nbytes].reshape(src.shape)
+                dst[:, : self.imageWidth - shift] = src[:, shift:]
+                dst[:, self.imageWidth - shift :] = src[:, :shift]
+                offset += src.nbytes
+        return self.payload
+
+
+def send_udp(gen, address, numFrames, fps=0.0, datagramBytes=50000):
+    # fps 0 sends as fast as possible
+    sender = ReplaySender(address, datagramBytes)
+    initPacket = gen.initPacket(0)
+    t_start = time.perf_counter()
+    for k in range(numFrames):
+        sender.send(k, initPacket, gen.frame(k).tobytes())
+        if fps > 0:
+            wait = t_start + (k + 1) / fps - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+    elapsed = time.perf_counter() - t_start
+    sender.close()
+    return {"frames": numFrames, "seconds": elapsed, "MBps": sender.bytesSent / elapsed / 1e6}
+
+
+def feed_queue(gen, packetInit: dict, q: queue.Queue, numFrames=None, fps=0.0, decodeSemantics=True):
+    # in-process replacement for UDP_ReceiverSingle.ReceiveData (same decode, same latest-wins queue)
+    UDP_ReceiverSingle.ParseInitPacket(gen.initPacket(-(-gen.frameBytes // 50000)), packetInit)
+    header = dict(packetInit)
+    t_start = time.perf_counter()
+    k = 0
+    while numFrames is None or k < numFrames:
+        decoded = UDP_ReceiverSingle.DecodeFrame(packetInit, gen.frame(k), decodeSemantics)
+        decoded.append(k)
+        decoded.append(header)
+        if q.full():
+            q.get()
+        q.put(decoded)
+        k += 1
+        if fps > 0:
+            wait = t_start + k / fps - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic sensor frames in the simulator wire format")
+    parser.add_argument("--target", choices=["udp", "queue"], default="queue")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12000)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--fps", type=float, default=0.0, help="0 : as fast as possible")
+    parser.add_argument("--sizes", default="256x256,512x512,1024x1024", help="camera resolutions to sweep")
+    parser.add_argument("--lidar", default="1024x32", help="lidar resolution x channels")
+    parser.add_argument("--classes", type=int, default=19)
+    parser.add_argument("--datagram-bytes", type=int, default=50000)
+    parser.add_argument("--no-semantics", action="store_true", help="queue target: skip the semantic decode")
+    args = parser.parse_args()
+
+    lidarRes, lidarChs = [int(v) for v in args.lidar.split("x")]
+
+    print(
+        "| image | frame MB | generate ms | {} | fps | MB/s |".format(
+            "send ms" if args.target == "udp" else "decode ms"
+        )
+    )
+    print("|-------|----------|-------------|---------|-----|------|")
+    for size in args.sizes.split(","):
+        width, height = [int(v) for v in size.split("x")]
+        gen = SyntheticFrames(lidarRes, lidarChs, width, height, args.classes)
+
+        t_start = time.perf_counter()
+        for k in range(args.frames):
+            gen.frame(k)
+        generateMs = (time.perf_counter() - t_start) / args.frames * 1000
+
+        if args.target == "udp":
+            stats = send_udp(gen, (args.host, args.port), args.frames, args.fps, args.datagram_bytes)
+            seconds = stats["seconds"]
+        else:
+            q = queue.Queue(maxsize=1)
+            done = threading.Event()
+
+            # stands in for PacketProcessing, only takes the frames off the queue
+            def consume():
+                while not done.is_set():
+                    try:
+                        q.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+
+            consumer = threading.Thread(target=consume, daemon=True)
+            consumer.start()
+            t_start = time.perf_counter()
+            feed_queue(gen, dict(), q, args.frames, args.fps, not args.no_semantics)
+            seconds = time.perf_counter() - t_start
+            done.set()
+            consumer.join()
+
+        stageMs = seconds / args.frames * 1000 - generateMs
+        print(
+            "| {} | {:.1f} | {:.2f} | {:.2f} | {:.1f} | {:.1f} |".format(
+                size,
+                gen.frameBytes / 1e6,
+                generateMs,
+                stageMs,
+                args.frames / seconds,
+                gen.frameBytes * args.frames / seconds / 1e6,
+            )
+        )
@@ -0,0 +1,160 @@
+import argparse
+import collections
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+import instrumentation
+
+# CPU undistortion of fisheye camera streams (init packet isFisheye != 0) in front of the texture upload.
+# The cameras follow the polynomial model of svm_real_image (distortPoint() in its shaders)
+#   r = K1 * theta + K2 * theta^3 + K3 * theta^5 + K4 * theta^7 + K5 * theta^9
+# which is OpenCV's fisheye model theta_d = theta * (1 + k1 * theta^2 + ..) with f * K1 as focal length and
+# k = K2..K5 / K1, so the maps come from cv.fisheye.initUndistortRectifyMap. They are built once per camera into a
+# pinhole image of the stream's size and horizontal Fov (what svm_ps_plane.glsl projects with), kept in the
+# fixed-point CV_16SC2 format and applied to the four cameras in parallel threads (cv.remap releases the GIL).
+# Cameras whose map is the identity are passed through untouched.
+
+calibrationPath = "../svm_real_image/config_raymarine.json"
+
+# the Raymarine intrinsics of svm_real_image/SVM_RealImgs.py, used for every camera the calibration file has no
+# "intrinsic_parameter" entry for (config_raymarine.json only carries the extrinsics)
+defaultIntrinsics = {
+    "K1": 1.281584985127447,
+    "K2": 0.170043067138006,
+    "K3": -0.023341058557079,
+    "K4": 0.007690791651144,
+    "K5": -0.001380968639013,
+    "fx": 345.12136354806347,
+    "fy": 346.09009197978003,
+    "cx": 959.5,
+    "cy": 539.5,
+    "img_width": 1920,
+    "img_height": 1080,
+}
+
+
+def load_intrinsics(path=None, numCameras=4):
+    # -> per camera intrinsics dict, "intrinsic_parameter": {"cameras": [{...}, ..]} entries override the defaults
+    cameras = []
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            cameras = json.load(f).get("intrinsic_parameter", {}).get("cameras", [])
+    return [dict(defaultIntrinsics, **(cameras[i] if i < len(cameras) else {})) for i in range(numCameras)]
+
+
+def fisheye_maps(intrinsics, width, height, fov):
+    # float maps (width x height pinhole image with horizontal fov -> fisheye pixel) of one camera,
+    # the intrinsics are scaled from their calibration resolution to the stream's
+    sx = width / intrinsics["img_width"]
+    sy = height / intrinsics["img_height"]
+    K1 = intrinsics["K1"]
+    K = np.array(
+        [
+            [intrinsics["fx"] * sx * K1, 0, (intrinsics["cx"] + 0.5) * sx - 0.5],
+            [0, intrinsics["fy"] * sy * K1, (intrinsics["cy"] + 0.5) * sy - 0.5],
+            [0, 0, 1],
+        ]
+    )
+    D = np.array([intrinsics[k] / K1 for k in ["K2", "K3", "K4", "K5"]])
+    f = width / 2 / math.tan(math.radians(fov) / 2)
+    P = np.array([[f, 0, (width - 1) / 2], [0, f, (height - 1) / 2], [0, 0, 1]])
+    return cv.fisheye.initUndistortRectifyMap(K, D, np.eye(3), P, (width, height), cv.CV_32FC1)
+
+
+def is_identity(mapX, mapY, tolerance=1e-3):
+    height, width = mapX.shape
+    return (
+        np.abs(mapX - np.arange(width, dtype=np.float32)[None, :]).max() < tolerance
+        and np.abs(mapY - np.arange(height, dtype=np.float32)[:, None]).max() < tolerance
+    )
+
+
+class Undistorter:
+    def __init__(self, intrinsics, width, height, fov, threads=4, window=100):
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self.maps = []
+        for intr in intrinsics:
+            mapX, mapY = fisheye_maps(intr, width, height, fov)
+            self.maps.append(None if is_identity(mapX, mapY) else cv.convertMaps(mapX, mapY, cv.CV_16SC2))
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="undistort")
+        # per camera durations of the last `window` frames, images and labels together
+        self.timings = [collections.deque(maxlen=window) for _ in intrinsics]
+
+    def matches(self, width, height, fov):
+        return (self.width, self.height, self.fov) == (width, height, fov)
+
+    def _camera(self, i, img, seg):
+        if self.maps[i] is None:
+            return img, seg
+        with instrumentation.timer("undistort.cam{}".format(i)):
+            t_start = time.perf_counter()
+            map1, map2 = self.maps[i]
+            img = cv.remap(img, map1, map2, cv.INTER_LINEAR, borderMode=cv.BORDER_CONSTANT)
+            if seg is not None:
+                # class ids must not be interpolated
+                seg = cv.remap(seg, map1, map2, cv.INTER_NEAREST, borderMode=cv.BORDER_CONSTANT)
+            self.timings[i].append(time.perf_counter() - t_start)
+        return img, seg
+
+    def apply(self, imgs, segs=None):
+        # -> undistorted imgs, segs (None stays None)
+        if all(maps is None for maps in self.maps):
+            return imgs, segs
+        segs_ = segs if segs is not None else [None] * len(imgs)
+        results = list(self.pool.map(self._camera, range(len(imgs)), imgs, segs_))
+        imgs = [img for img, _ in results]
+        if segs is not None:
+            segs = [seg for _, seg in results]
+        return imgs, segs
+
+    def stats(self):
+        # mean ms per frame of every camera, None for the skipped ones
+        return [
+            (float(np.mean(t)) * 1000 if len(t) else 0.0) if maps is not None else None
+            for t, maps in zip(self.timings, self.maps)
+        ]
+
+    def close(self):
+        self.pool.shutdown()
+
+
+if __name__ == "__main__":
+    from synthetic_frames import SyntheticFrames
+    import UDP_ReceiverSingle
+
+    parser = argparse.ArgumentParser(description="Time the fisheye undistortion stage on synthetic frames")
+    parser.add_argument("--image", default="1024x1024")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--calibration", default=calibrationPath)
+    args = parser.parse_args()
+
+    width, height = [int(v) for v in args.image.split("x")]
+    gen = SyntheticFrames(64, 8, width, height, isFisheye=1)
+    packetInit = {}
+    UDP_ReceiverSingle.ParseInitPacket(gen.initPacket(0), packetInit)
+
+    t_start = time.perf_counter()
+    undistorter = Undistorter(load_intrinsics(args.calibration), width, height, packetInit["Fov"], args.threads)
+    print("maps : {:.1f} ms".format((time.perf_counter() - t_start) * 1000))
+
+    frameMs = []
+    for k in range(args.frames):
+        imgs, segBgra = UDP_ReceiverSingle.DecodeImages(packetInit, bytearray(gen.frame(k)))
+        segs = [seg[..., 0].copy() for seg in segBgra]
+        t_start = time.perf_counter()
+        undistorter.apply(imgs, segs)
+        frameMs.append((time.perf_counter() - t_start) * 1000)
+    undistorter.close()
+
+    print("frame : {:.2f} ms ({} threads)".format(np.mean(frameMs), args.threads))
+    for i, ms in enumerate(undistorter.stats()):
+        print("camera {} : {}".format(i, "skipped" if ms is None else "{:.2f} ms".format(ms)))
@@ -1,4 +1,3 @@
-import json
 import os
 
 import cv2 as cv
@@ -9,21 +8,32 @@ from direct.showbase.ShowBase import ShowBase
 from direct.task import Task
 from panda3d.core import Shader
 
+import calibration
+import fisheye_lut
+from frame_cache import FrameCache, has_cache
+from frame_prefetcher import FramePrefetcher, prepareSemantic
+from label_pack import open_replay, semantic_path
+from video_replay import VideoReplay
+
 still_shot_mode = False  # Set this variable to True or False to enable or disable still shot mode
 
-with open("./config_raymarine.json") as f:
-    calib = json.load(f)
+# decode the replay streams in background threads (see frame_prefetcher.py)
+prefetch_mode = True
+prefetch_lookahead = 4
+prefetch_drop_if_behind = True  # keep rendering the previous frame instead of waiting for the decoder
+
+# sample the K1..K5 fisheye model from per-camera lookup textures built at init (see fisheye_lut.py)
+# instead of evaluating distortPoint() for every fragment, "u" toggles it at runtime
+fisheye_lut_mode = True
 
-boat_breadth = calib["boat_type"]["custom_breadth"] * 100
-boat_length = calib["boat_type"]["custom_length"] * 100
+calib = calibration.load("./config_raymarine.json")
 
-extrinsic_parameter = calib["extrinsic_parameter"]["cameras"]
-del extrinsic_parameter[1:3]
-extrinsic_parameter[2], extrinsic_parameter[3] = extrinsic_parameter[3], extrinsic_parameter[2]
-for extrinsic in extrinsic_parameter:
-    extrinsic["location"]["translation_x"] *= 100
-    extrinsic["location"]["translation_y"] *= 100
-    extrinsic["location"]["translation_z"] *= 100
+boat_breadth = calib.boat_breadth
+boat_length = calib.boat_length
+
+# cameras of the SVM by calibration name (see calibration.cameraNames), in the order of the texture array layers
+camera_positions = ["front", "right", "rear", "left"]
+calib.select(camera_positions)  # fails early on a camera the file does not have
 
 K1 = 1.281584985127447
 K2 = 0.170043067138006
@@ -251,11 +261,17 @@ class SurroundView(ShowBase):
         self.accept("1", self.setDebugMode, [0])
         self.accept("2", self.setDebugMode, [1])
         self.accept("3", self.setDebugMode, [2])
+        self.accept("u", lambda: self.setFisheyeLut(not self.fisheyeLut))
 
         self.taskMgr.add(self.readTextureData, "readTextureData")
         self.buffer1.set_active(False)
         self.buffer2.set_active(False)
 
+    def setFisheyeLut(self, on):
+        self.fisheyeLut = on
+        self.plane.setShaderInput("useUvLut", int(on))
+        self.interquad.setShaderInput("useUvLut", int(on))
+
     def setDebugMode(self, mode):
         self.debug_mode = mode
         self.interquad.setShaderInput("debug_mode", mode)
@@ -439,162 +455,11 @@ class SurroundView(ShowBase):
         )
 
 
-def make_extrinsic_matrix(extrinsic):
-    defaultYaw = 0
-    # camera_position = int(extrinsic["camera_position"])
-    # if camera_position == 1:
-    #     print("position is 1")
-    #     defaultYaw = 0
-    # elif camera_position == 2:
-    #     print("position is 2")
-    #     defaultYaw = 90
-    # elif camera_position == 3:
-    #     print("position is 3")
-    #     defaultYaw = -90
-    # elif camera_position == 4:
-    #     print("position is 4")
-    #     defaultYaw = 90
-    # elif camera_position == 5:
-    #     print("position is 5")
-    #     defaultYaw = -90
-    # elif camera_position == 6:
-    #     print("position is 6")
-    #     defaultYaw = 180
-    rotation = [
-        -extrinsic["rotation"]["pitch"],
-        extrinsic["rotation"]["roll"],
-        -extrinsic["rotation"]["yaw"] - defaultYaw,
-    ]
-    translation = [
-        extrinsic["location"]["translation_x"],
-        extrinsic["location"]["translation_y"],
-        extrinsic["location"]["translation_z"],
-    ]
-    rotation_matrix0 = euler_to_matrix(rotation)
-    rotation_matrix1 = euler_to_matrix([0, 0, -90])
-    rotation_matrix = rotation_matrix1 @ rotation_matrix0
-    return translation, rotation_matrix
-
-
-def euler_to_matrix(euler_angle):
-    """
-    :param euler_angle: [x,y,z] in degree
-    :return: rotation matrix
-    """
-    # calculate rotation about the x-axis
-    R_x = np.array(
-        [
-            [1.0, 0.0, 0.0],
-            [0.0, np.cos(np.deg2rad(-euler_angle[0])), -np.sin(np.deg2rad(-euler_angle[0]))],
-            [0.0, np.sin(np.deg2rad(-euler_angle[0])), np.cos(np.deg2rad(-euler_angle[0]))],
-        ],
-        dtype=float,
-    )
-    # calculate rotation about the y-axis
-    R_y = np.array(
-        [
-            [np.cos(np.deg2rad(-euler_angle[1])), 0.0, np.sin(np.deg2rad(-euler_angle[1]))],
-            [0.0, 1.0, 0.0],
-            [-np.sin(np.deg2rad(-euler_angle[1])), 0.0, np.cos(np.deg2rad(-euler_angle[1]))],
-        ],
-        dtype=float,
-    )
-    # calculate rotation about the z-axis
-    R_z = np.array(
-        [
-            [np.cos(np.deg2rad(-euler_angle[2])), -np.sin(np.deg2rad(-euler_angle[2])), 0.0],
-            [np.sin(np.deg2rad(-euler_angle[2])), np.cos(np.deg2rad(-euler_angle[2])), 0.0],
-            [0.0, 0.0, 1.0],
-        ],
-        dtype=float,
-    )
-    return R_z @ R_y @ R_x
-
-
-def computeLookAtRH(eye, center, up):
-    z = eye - center
-    z.normalize()
-    x = up.cross(z)
-    x.normalize()
-    y = z.cross(x)
-    # print(("x {}").format(x))
-    # print(("y {}").format(y))
-    # print(("z {}").format(z))
-    # row major in pand3d core but memory convention is based on the conventional column major
-    matLookAt = p3d.LMatrix4f(
-        x[0],
-        y[0],
-        z[0],
-        0.0,
-        x[1],
-        y[1],
-        z[1],
-        0.0,
-        x[2],
-        y[2],
-        z[2],
-        0.0,
-        -p3d.LVector3f.dot(x, eye),
-        -p3d.LVector3f.dot(y, eye),
-        -p3d.LVector3f.dot(z, eye),
-        1.0,
-    )
-    return matLookAt
-
-
-def make_view_matrix(translation, rotation_matrix):
-    T = p3d.LMatrix4f().translateMat(*translation)
-    R = p3d.LMatrix4f(p3d.LMatrix3f(*rotation_matrix.flatten()))
-    R.transposeInPlace()
-    view2world = R * T
-    camPos = view2world.xformPoint(p3d.Vec3(0, 0, 0))
-    camView = view2world.xformVec(p3d.Vec3(0, 0, 1)).normalized()
-    camUp = view2world.xformVec(p3d.Vec3(0, -1, 0)).normalized()
-    # print(("camPos {}").format(camPos))
-    # print(("camView {}").format(camView))
-    # print(("camUp  {}").format(camUp))
-    return computeLookAtRH(camPos, camPos + camView, camUp)
-
-
-def make_projection_matrix(fx, fy, skew_c, cx, cy, img_width, img_height, near_p, far_p):
-    q = far_p / (near_p - far_p)
-    qn = far_p * near_p / (near_p - far_p)
-
-    projection_matrix = p3d.LMatrix4f()
-    projection_matrix[0][0] = 2.0 * fx / img_width
-    projection_matrix[1][0] = -2.0 * skew_c / img_width
-    projection_matrix[2][0] = (img_width + 2.0 * 0 - 2.0 * cx) / img_width
-    projection_matrix[3][0] = 0
-    projection_matrix[0][1] = 0
-    projection_matrix[1][1] = 2.0 * fy / img_height
-    projection_matrix[2][1] = -(img_height + 2.0 * 0 - 2.0 * cy) / img_height
-    projection_matrix[3][1] = 0
-    projection_matrix[0][2] = 0
-    projection_matrix[1][2] = 0
-    projection_matrix[2][2] = q
-    projection_matrix[3][2] = qn
-    projection_matrix[0][3] = 0
-    projection_matrix[1][3] = 0
-    projection_matrix[2][3] = -1.0
-    projection_matrix[3][3] = 0
-
-    # projection_matrix.transposeInPlace()
-    return projection_matrix
-
-
 def InitSVM(base, imageWidth, imageHeight):
-    matProj = make_projection_matrix(fx, fy, skew_c, cx, cy, imageWidth, imageHeight, 10, 10000)
-    # projMat.transposeInPlace()
-
-    matViewProjs = [p3d.LMatrix4f(), p3d.LMatrix4f(), p3d.LMatrix4f(), p3d.LMatrix4f()]
-    for i, extrinsic in enumerate(extrinsic_parameter):
-        translation, rotation_matrix = make_extrinsic_matrix(extrinsic)
-        matView = make_view_matrix(translation, rotation_matrix)
-        matViewProj = matView * matProj
-        matViewProjs[i] = matViewProj
-
-        base.plane.setShaderInput("matViewProj" + str(i), matViewProj)
-        base.interquad.setShaderInput("matViewProj" + str(i), matViewProj)
+    matViewProjs = calib.view_projs(camera_positions, fx, fy, skew_c, cx, cy, imageWidth, imageHeight, 10, 10000)
+    for i, matViewProj in enumerate(matViewProjs):
+        base.plane.setShaderInput("matViewProj" + str(i), calibration.to_p3d(matViewProj))
+        base.interquad.setShaderInput("matViewProj" + str(i), calibration.to_p3d(matViewProj))
 
     base.planeTexArray.setup2dTextureArray(imageWidth, imageHeight, 4, p3d.Texture.T_unsigned_byte, p3d.Texture.F_rgba)
     base.plane.setShaderInput("cameraImgs", base.planeTexArray)
@@ -602,23 +467,25 @@ def InitSVM(base, imageWidth, imageHeight):
     base.semanticTexArray.setup2dTextureArray(imageWidth, imageHeight, 4, p3d.Texture.T_int, p3d.Texture.F_r32i)
     base.plane.setShaderInput("semanticImgs", base.semanticTexArray)
 
+    # the cameras share one set of intrinsics, one lookup layer per camera all the same
+    K = [K1, K2, K3, K4, K5]
+    uvLut = fisheye_lut.build_uv_lut(K, fx, fy, cx, cy, imageWidth, imageHeight)
+    base.uvLutTexture = fisheye_lut.make_lut_texture([uvLut] * len(camera_positions))
+    for node in [base.plane, base.interquad]:
+        node.setShaderInput("uvLuts", base.uvLutTexture)
+        node.setShaderInput("uvLutScale", fisheye_lut.lutScale)
+    base.setFisheyeLut(fisheye_lut_mode)
+
     # print("Texture Initialized!")
 
 
 base_path = "./src/RM_data3"
-camera_positions = ["front", "right", "rear", "left"]
-
-caps = []
-semantic_caps = []
+# preprocessed frames written by `python frame_cache.py`, used instead of the videos when present
+cache_dir = "./src/RM_data3/cache"
 
-for position in camera_positions:
-    cap = cv.VideoCapture(os.path.join(base_path, position + "_cam.webm"))
-    caps.append(cap)
-
-    semantic_cap = cv.VideoCapture(os.path.join(base_path, "semantic_" + position + ".webm"))
-    semantic_caps.append(semantic_cap)
-
-num_images = int(caps[0].get(cv.CAP_PROP_FRAME_COUNT))
+# the four camera streams and the four semantic streams (lossless .rle label packs when available), read in lockstep
+camera_paths = [os.path.join(base_path, position + "_cam.webm") for position in camera_positions]
+semantic_paths = [semantic_path(base_path, position) for position in camera_positions]
 
 current_idx = 0
 
@@ -629,18 +496,18 @@ def loadNextImage(task):
     imgs = []
     semantics = []
 
+    if replay.position >= num_images:
+        replay.seek(0)
+        semantic_replay.seek(0)
+    current_idx = replay.position
+    frames = replay.read()
+    semantic_frames = semantic_replay.read()
     for i, position in enumerate(camera_positions):
-        caps[i].set(cv.CAP_PROP_POS_FRAMES, current_idx)
-        _, img = caps[i].read()
-        img = cv.resize(img, (img_width, img_height))
+        img = cv.resize(frames[i], (img_width, img_height))
         img = cv.cvtColor(img, cv.COLOR_BGR2BGRA)
         imgs.append(img)
 
-        semantic_caps[i].set(cv.CAP_PROP_POS_FRAMES, current_idx)
-        _, semantic = semantic_caps[i].read()
-        semantic = cv.resize(semantic, (img_width, img_height), cv.INTER_NEAREST)
-        semantic = cv.cvtColor(semantic, cv.COLOR_BGR2GRAY)
-        semantics.append(semantic)
+        semantics.append(prepareSemantic(semantic_frames[i], img_width, img_height))
 
     imgnpArray = np.array(imgs).astype(np.uint8)
     imgArray = imgnpArray.reshape((4, img_width, img_height, 4))
@@ -650,9 +517,30 @@ def loadNextImage(task):
     mySvm.planeTexArray.setRamImage(cameraArray)
     mySvm.semanticTexArray.setRamImage(semanticArray)
 
-    current_idx += 1
-    if current_idx >= num_images:
-        current_idx = 0  # Reset the index to loop back to the first image
+    return Task.cont
+
+
+def loadCachedImage(task):
+    global current_idx
+
+    cameraArray, semanticArray = frameCache.get(current_idx)
+    mySvm.planeTexArray.setRamImage(cameraArray)
+    mySvm.semanticTexArray.setRamImage(semanticArray)
+
+    current_idx = (current_idx + 1) % frameCache.numFrames
+    return Task.cont
+
+
+def loadPrefetchedImage(task):
+    global current_idx
+
+    frame = prefetcher.get()
+    if frame is None:
+        return Task.cont
+
+    current_idx, cameraArray, semanticArray = frame
+    mySvm.planeTexArray.setRamImage(cameraArray)
+    mySvm.semanticTexArray.setRamImage(semanticArray)
 
     return Task.cont
 
@@ -661,18 +549,16 @@ def loadDebugImages():
     imgs = []
     semantics = []
 
+    replay.seek(current_idx)
+    semantic_replay.seek(current_idx)
+    frames = replay.read()
+    semantic_frames = semantic_replay.read()
     for i, position in enumerate(camera_positions):
-        caps[i].set(cv.CAP_PROP_POS_FRAMES, current_idx)
-        _, img = caps[i].read()
-        img = cv.resize(img, (img_width, img_height))
+        img = cv.resize(frames[i], (img_width, img_height))
         img = cv.cvtColor(img, cv.COLOR_BGR2BGRA)
         imgs.append(img)
 
-        semantic_caps[i].set(cv.CAP_PROP_POS_FRAMES, current_idx)
-        _, semantic = semantic_caps[i].read()
-        semantic = cv.resize(semantic, (img_width, img_height), cv.INTER_NEAREST)
-        semantic = cv.cvtColor(semantic, cv.COLOR_BGR2GRAY)
-        semantics.append(semantic)
+        semantics.append(prepareSemantic(semantic_frames[i], img_width, img_height))
 
     imgnpArray = np.array(imgs).astype(np.uint8)
     imgArray = imgnpArray.reshape((4, img_width, img_height, 4))
@@ -692,9 +578,42 @@ if __name__ == "__main__":
 
     InitSVM(mySvm, img_width, img_height)
 
+    # opened here and not at import, frame_cache.py imports this module for its settings
+    replay = VideoReplay(camera_paths)
+    semantic_replay = open_replay(semantic_paths)
+    num_images = min(replay.numFrames, semantic_replay.numFrames)
+
+    prefetcher = None
     if still_shot_mode:
         loadDebugImages()
+    elif has_cache(cache_dir, camera_paths, semantic_paths, img_width, img_height):
+        replay.release()
+        semantic_replay.release()
+        frameCache = FrameCache(cache_dir)
+        mySvm.taskMgr.add(loadCachedImage, "LoadNextImageTask")
+    elif prefetch_mode:
+        replay.release()
+        semantic_replay.release()
+        prefetcher = FramePrefetcher(
+            camera_paths,
+            semantic_paths,
+            img_width,
+            img_height,
+            prefetch_lookahead,
+            prefetch_drop_if_behind,
+        ).start()
+        mySvm.taskMgr.add(loadPrefetchedImage, "LoadNextImageTask")
+        mySvm.accept("f", lambda: print("prefetcher : {}".format(prefetcher.stats())))
     else:
         mySvm.taskMgr.add(loadNextImage, "LoadNextImageTask")
+        mySvm.accept(
+            "f",
+            lambda: print("decode fps per stream : {}".format(replay.decodeFps() + semantic_replay.decodeFps())),
+        )
 
-    mySvm.run()
+    try:
+        mySvm.run()
+    finally:
+        # shuts down the decode threads and closes the streams
+        if prefetcher is not None:
+            prefetcher.stop()
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import numbers
+
+import numpy as np
+import panda3d.core as p3d
+
+# Camera calibration of the real-image SVM (config_raymarine.json).
+#   calib = calibration.load("./config_raymarine.json")
+#   calib.select(["front", "right", "rear", "left"])    -> extrinsics of those cameras, translations in cm
+#   calib.view_projs(["front", ...], fx, fy, ...)       -> (n, 4, 4) float32 matViewProj of svm_ps_plane_real.glsl
+# The file is validated on load, the view matrices of every camera are built once and the result is cached by the
+# file's hash, so loading the same file again costs one read. Matrices are NumPy arrays in Panda3D's row-vector
+# layout (np.array(LMatrix4f)), to_p3d() turns them back into LMatrix4f for setShaderInput.
+
+# camera_position of the file -> name
+cameraNames = {"1": "front", "2": "front_right", "3": "front_left", "4": "right", "5": "left", "6": "rear"}
+
+# misspelled keys found in calibration files -> correct key
+keyAliases = {"translaion_x": "translation_x"}
+
+_cache = {}
+
+
+def make_extrinsic_matrix(extrinsic):
+    defaultYaw = 0
+    # camera_position = int(extrinsic["camera_position"])
+    # if camera_position == 1:
+    #     print("position is 1")
+    #     defaultYaw = 0
+    # elif camera_position == 2:
+    #     print("position is 2")
+    #     defaultYaw = 90
+    # elif camera_position == 3:
+    #     print("position is 3")
+    #     defaultYaw = -90
+    # elif camera_position == 4:
+    #     print("position is 4")
+    #     defaultYaw = 90
+    # elif camera_position == 5:
+    #     print("position is 5")
+    #     defaultYaw = -90
+    # elif camera_position == 6:
+    #     print("position is 6")
+    #     defaultYaw = 180
+    rotation = [
+        -extrinsic["rotation"]["pitch"],
+        extrinsic["rotation"]["roll"],
+        -extrinsic["rotation"]["yaw"] - defaultYaw,
+    ]
+    translation = [
+        extrinsic["location"]["translation_x"],
+        extrinsic["location"]["translation_y"],
+        extrinsic["location"]["translation_z"],
+    ]
+    rotation_matrix0 = euler_to_matrix(rotation)
+    rotation_matrix1 = euler_to_matrix([0, 0, -90])
+    rotation_matrix = rotation_matrix1 @ rotation_matrix0
+    return translation, rotation_matrix
+
+
+def euler_to_matrix(euler_angle):
+    """
+    :param euler_angle: [x,y,z] in degree
+    :return: rotation matrix
+    """
+    # calculate rotation about the x-axis
+    R_x = np.array(
+        [
+            [1.0, 0.0, 0.0],
+            [0.0, np.cos(np.deg2rad(-euler_angle[0])), -np.sin(np.deg2rad(-euler_angle[0]))],
+            [0.0, np.sin(np.deg2rad(-euler_angle[0])), np.cos(np.deg2rad(-euler_angle[0]))],
+        ],
+        dtype=float,
+    )
+    # calculate rotation about the y-axis
+    R_y = np.array(
+        [
+            [np.cos(np.deg2rad(-euler_angle[1])), 0.0, np.sin(np.deg2rad(-euler_angle[1]))],
+            [0.0, 1.0, 0.0],
+            [-np.sin(np.deg2rad(-euler_angle[1])), 0.0, np.cos(np.deg2rad(-euler_angle[1]))],
+        ],
+        dtype=float,
+    )
+    # calculate rotation about the z-axis
+    R_z = np.array(
+        [
+            [np.cos(np.deg2rad(-euler_angle[2])), -np.sin(np.deg2rad(-euler_angle[2])), 0.0],
+            [np.sin(np.deg2rad(-euler_angle[2])), np.cos(np.deg2rad(-euler_angle[2])), 0.0],
+            [0.0, 0.0, 1.0],
+        ],
+        dtype=float,
+    )
+    return R_z @ R_y @ R_x
+
+
+def computeLookAtRH(eye, center, up):
+    z = eye - center
+    z.normalize()
+    x = up.cross(z)
+    x.normalize()
+    y = z.cross(x)
+    # print(("x {}").format(x))
+    # print(("y {}").format(y))
+    # print(("z {}").format(z))
+    # row major in pand3d core but memory convention is based on the conventional column major
+    matLookAt = p3d.LMatrix4f(
+        x[0],
+        y[0],
+        z[0],
+        0.0,
+        x[1],
+        y[1],
+        z[1],
+        0.0,
+        x[2],
+        y[2],
+        z[2],
+        0.0,
+        -p3d.LVector3f.dot(x, eye),
+        -p3d.LVector3f.dot(y, eye),
+        -p3d.LVector3f.dot(z, eye),
+        1.0,
+    )
+    return matLookAt
+
+
+def make_view_matrix(translation, rotation_matrix):
+    T = p3d.LMatrix4f().translateMat(*translation)
+    R = p3d.LMatrix4f(p3d.LMatrix3f(*rotation_matrix.flatten()))
+    R.transposeInPlace()
+    view2world = R * T
+    camPos = view2world.xformPoint(p3d.Vec3(0, 0, 0))
+    camView = view2world.xformVec(p3d.Vec3(0, 0, 1)).normalized()
+    camUp = view2world.xformVec(p3d.Vec3(0, -1, 0)).normalized()
+    # print(("camPos {}").format(camPos))
+    # print(("camView {}").format(camView))
+    # print(("camUp  {}").format(camUp))
+    return computeLookAtRH(camPos, camPos + camView, camUp)
+
+
+def make_projection_matrix(fx, fy, skew_c, cx, cy, img_width, img_height, near_p, far_p):
+    q = far_p / (near_p - far_p)
+    qn = far_p * near_p / (near_p - far_p)
+
+    projection_matrix = p3d.LMatrix4f()
+    projection_matrix[0][0] = 2.0 * fx / img_width
+    projection_matrix[1][0] = -2.0 * skew_c / img_width
+    projection_matrix[2][0] = (img_width + 2.0 * 0 - 2.0 * cx) / img_width
+    projection_matrix[3][0] = 0
+    projection_matrix[0][1] = 0
+    projection_matrix[1][1] = 2.0 * fy / img_height
+    projection_matrix[2][1] = -(img_height + 2.0 * 0 - 2.0 * cy) / img_height
+    projection_matrix[3][1] = 0
+    projection_matrix[0][2] = 0
+    projection_matrix[1][2] = 0
+    projection_matrix[2][2] = q
+    projection_matrix[3][2] = qn
+    projection_matrix[0][3] = 0
+    projection_matrix[1][3] = 0
+    projection_matrix[2][3] = -1.0
+    projection_matrix[3][3] = 0
+
+    # projection_matrix.transposeInPlace()
+    return projection_matrix
+
+
+def to_p3d(matrix):
+    return p3d.LMatrix4f(*np.asarray(matrix, dtype=np.float32).ravel())
+
+
+def _number(value, where):
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        raise ValueError("{} must be a number, got {!r}".format(where, value))
+    return float(value)
+
+
+def _section(parent, key, where):
+    if not isinstance(parent, dict) or key not in parent:
+        raise ValueError("{} is missing {!r}".format(where, key))
+    return parent[key]
+
+
+def parse_calibration(calib, source="calibration"):
+    # raw json dict -> (boat_breadth, boat_length, {name: extrinsic}) in cm, the input is left untouched
+    boat = _section(calib, "boat_type", source)
+    boat_breadth = _number(_section(boat, "custom_breadth", source + " boat_type"), source + " custom_breadth") * 100
+    boat_length = _number(_section(boat, "custom_length", source + " boat_type"), source + " custom_length") * 100
+
+    cameras = _section(_section(calib, "extrinsic_parameter", source), "cameras", source + " extrinsic_parameter")
+    if not isinstance(cameras, list) or not cameras:
+        raise ValueError("{} extrinsic_parameter.cameras must be a non-empty list".format(source))
+
+    extrinsics = {}
+    for k, camera in enumerate(cameras):
+        where = "{} camera #{}".format(source, k)
+        position = str(_section(camera, "camera_position", where))
+        name = cameraNames.get(position, position)
+        where = "{} camera {} ({})".format(source, position, name)
+        if name in extrinsics:
+            raise ValueError("{} appears twice".format(where))
+
+        location = dict(_section(camera, "location", where))
+        for alias, key in keyAliases.items():
+            if alias in location and key not in location:
+                print("{}: reading location.{} as {}".format(where, alias, key))
+                location[key] = location.pop(alias)
+        rotation = _section(camera, "rotation", where)
+
+        extrinsics[name] = {
+            "camera_position": position,
+            "location": {
+                key: _number(_section(location, key, where + " location"), "{} location.{}".format(where, key)) * 100
+                for key in ["translation_x", "translation_y", "translation_z"]
+            },
+            "rotation": {
+                key: _number(_section(rotation, key, where + " rotation"), "{} rotation.{}".format(where, key))
+                for key in ["pitch", "roll", "yaw"]
+            },
+        }
+    return boat_breadth, boat_length, extrinsics
+
+
+class Calibration:
+    def __init__(self, calib, source="calibration"):
+        self.boat_breadth, self.boat_length, self.extrinsics = parse_calibration(calib, source)
+        self.names = list(self.extrinsics)
+
+        self.view_matrices = {}
+        self.camera_positions = {}
+        for name, extrinsic in self.extrinsics.items():
+            translation, rotation_matrix = make_extrinsic_matrix(extrinsic)
+            self.view_matrices[name] = np.array(make_view_matrix(translation, rotation_matrix), dtype=np.float32)
+            self.camera_positions[name] = np.array(translation, dtype=np.float32)
+        self._projections = {}
+
+    def _check(self, names):
+        unknown = [name for name in names if name not in self.extrinsics]
+        if unknown:
+            raise KeyError("unknown camera(s) {}, the calibration has {}".format(unknown, self.names))
+
+    def select(self, names):
+        self._check(names)
+        return [self.extrinsics[name] for name in names]
+
+    def projection_matrix(self, fx, fy, skew_c, cx, cy, img_width, img_height, near_p=10, far_p=10000):
+        key = (fx, fy, skew_c, cx, cy, img_width, img_height, near_p, far_p)
+        if key not in self._projections:
+            self._projections[key] = np.array(make_projection_matrix(*key), dtype=np.float32)
+        return self._projections[key]
+
+    def view_projs(self, names, fx, fy, skew_c, cx, cy, img_width, img_height, near_p=10, far_p=10000):
+        # (n, 4, 4) matView * matProj of the named cameras (row vectors, like Panda3D)
+        self._check(names)
+        matProj = self.projection_matrix(fx, fy, skew_c, cx, cy, img_width, img_height, near_p, far_p)
+        return np.array([self.view_matrices[name] @ matProj for name in names])
+
+
+def load(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    key = hashlib.sha1(data).hexdigest()
+    if key not in _cache:
+        _cache[key] = Calibration(json.loads(data), path)
+    return _cache[key]
@@ -0,0 +1,74 @@
+import numpy as np
+import panda3d.core as p3d
+
+# Fisheye UV lookup for the real-image SVM shaders.
+# The cameras are projected with the pinhole make_projection_matrix(), the K1..K5 polynomial model then maps the
+# pinhole image position to the fisheye one (distortPoint() in the shaders):
+#   p = (uv * size - c) / f,  theta = atan(|p|),  r = K1 * theta + K2 * theta^3 + ... + K5 * theta^9
+#   uv' = (r * p / |p| * f + c) / size
+# build_uv_lut() evaluates this once per camera on a grid over the pinhole NDC (imagePos.xy / imagePos.w) and the
+# shaders sample it instead (lookupUv()). The NDC is unbounded towards 90 degrees off axis, the grid is laid out over
+# the compressed coordinate t = ndc / (lutScale + |ndc|) in (-1, 1), dense near the optical axis.
+
+# 512 x 512 with scale 2 stays within 0.024 px of distortPoint() on a 1920 x 1080 image over ndc in [-6, 6]
+# (headless GPU render of both shader paths, sample_uv_lut() against distort_points() gives 0.023 px), the error grows
+# further off axis (0.26 px at |ndc| = 30)
+lutSize = 512
+lutScale = 2.0
+
+
+def distort_points(uv, K, fx, fy, cx, cy, img_width, img_height):
+    # numpy distortPoint(), uv : (..., 2) pinhole texture coordinates -> fisheye texture coordinates
+    x = (uv[..., 0] * img_width - cx) / fx
+    y = (uv[..., 1] * img_height - cy) / fy
+    rCam = np.sqrt(x * x + y * y)
+    theta = np.arctan(rCam)
+    phi = np.arctan2(y, x)
+    radial_distance = sum(k * theta ** (2 * i + 1) for i, k in enumerate(K))
+    out = np.empty(uv.shape, dtype=np.float32)
+    out[..., 0] = (radial_distance * np.cos(phi) * fx + cx) / img_width
+    out[..., 1] = (radial_distance * np.sin(phi) * fy + cy) / img_height
+    return out
+
+
+def lut_ndc(size=lutSize, scale=lutScale):
+    # NDC of the lookup texel centres, (size, size, 2), row j is t_y, column i is t_x
+    t = (np.arange(size) + 0.5) / size * 2 - 1
+    ndc = scale * t / (1 - np.abs(t))
+    out = np.empty((size, size, 2), dtype=np.float64)
+    out[..., 0] = ndc[None, :]
+    out[..., 1] = ndc[:, None]
+    return out
+
+
+def build_uv_lut(K, fx, fy, cx, cy, img_width, img_height, size=lutSize, scale=lutScale):
+    # -> (size, size, 2) float32 fisheye texture coordinates over the compressed pinhole NDC
+    uv = (lut_ndc(size, scale) + 1.0) * 0.5
+    return distort_points(uv, K, fx, fy, cx, cy, img_width, img_height)
+
+
+def sample_uv_lut(lut, ndc, scale=lutScale):
+    # bilinear lookup on the CPU, what texture(uvLuts, ...) returns in the shaders
+    size = lut.shape[0]
+    t = ndc / (scale + np.abs(ndc))
+    pos = np.clip((t + 1) * 0.5 * size - 0.5, 0, size - 1)
+    i0 = np.minimum(pos.astype(np.int32), size - 2)
+    f = pos - i0
+    fx, fy = f[..., 0:1], f[..., 1:2]
+    x0, y0 = i0[..., 0], i0[..., 1]
+    top = lut[y0, x0] * (1 - fx) + lut[y0, x0 + 1] * fx
+    bottom = lut[y0 + 1, x0] * (1 - fx) + lut[y0 + 1, x0 + 1] * fx
+    return top * (1 - fy) + bottom * fy
+
+
+def make_lut_texture(luts):
+    # list of per-camera lookups -> 2d texture array (F_rg32, linear filtering, clamped) for the uvLuts input
+    size = luts[0].shape[0]
+    texture = p3d.Texture("uvLuts")
+    texture.setup2dTextureArray(size, size, len(luts), p3d.Texture.T_float, p3d.Texture.F_rg32)
+    texture.setRamImage(np.ascontiguousarray(np.array(luts, dtype=np.float32)))
+    texture.setMinfilter(p3d.SamplerState.FT_linear)
+    texture.setMagfilter(p3d.SamplerState.FT_linear)
+    texture.setWrapU(p3d.SamplerState.WM_clamp)
+    texture.setWrapV(p3d.SamplerState.WM_clamp)
+    return texture
@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from frame_prefetcher import prepareCamera, prepareSemantic
+from label_pack import open_replay
+
+# On-disk cache of ready-to-upload replay frames.
+# cameras.npy (N, numCams, H, W, 4) BGRA uint8 and semantics.npy (N, numCams, H, W) int32, frame-major in the layout
+# and dtypes of planeTexArray / semanticTexArray, opened with mmap so a frame is two contiguous slices read straight
+# from the page cache and handed to setRamImage without conversion.
+# index.json records the layout version, resolution, frame count and the size and mtime of the source streams, a cache
+# of another version, resolution or sources is not used (has_cache()).
+
+indexName = "index.json"
+cacheVersion = 2
+
+
+def build_cache(cacheDir, cameraPaths, semanticPaths, width, height, numFrames=None):
+    os.makedirs(cacheDir, exist_ok=True)
+    streams = [("camera", cam, path) for cam, path in enumerate(cameraPaths)]
+    streams += [("semantic", cam, path) for cam, path in enumerate(semanticPaths)]
+    if numFrames is None:
+        numFrames = min(open_replay([path]).numFrames for _, _, path in streams)
+
+    index = {
+        "version": cacheVersion,
+        "width": width,
+        "height": height,
+        "numFrames": numFrames,
+        "sources": source_stamps(cameraPaths + semanticPaths),
+    }
+    cameras = np.lib.format.open_memmap(
+        os.path.join(cacheDir, "cameras.npy"),
+        mode="w+",
+        dtype=np.uint8,
+        shape=(numFrames, len(cameraPaths), height, width, 4),
+    )
+    semantics = np.lib.format.open_memmap(
+        os.path.join(cacheDir, "semantics.npy"),
+        mode="w+",
+        dtype=np.int32,
+        shape=(numFrames, len(semanticPaths), height, width),
+    )
+    for kind, cam, path in streams:
+        t_start = time.perf_counter()
+        replay = open_replay([path])
+        for i in range(numFrames):
+            if kind == "camera":
+                prepareCamera(replay.read()[0], width, height, dst=cameras[i, cam])
+            else:
+                semantics[i, cam] = prepareSemantic(replay.read()[0], width, height)
+        replay.release()
+        print("{} : {} frames in {:.1f} s".format(path, numFrames, time.perf_counter() - t_start))
+    cameras.flush()
+    semantics.flush()
+    del cameras, semantics
+
+    with open(os.path.join(cacheDir, indexName), "w") as f:
+        json.dump(index, f, indent=4)
+
+
+def source_stamps(paths):
+    # [path, size, mtime] of every source stream, None for missing files
+    stamps = []
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamps.append([os.path.normpath(path), stat.st_size, stat.st_mtime_ns])
+        else:
+            stamps.append([os.path.normpath(path), None, None])
+    return stamps
+
+
+def stale_reason(cacheDir, cameraPaths, semanticPaths, width, height):
+    # None when the cache was built from these streams at this resolution, what differs otherwise
+    with open(os.path.join(cacheDir, indexName)) as f:
+        index = json.load(f)
+    if index.get("version") != cacheVersion:
+        return "built by an older frame_cache.py"
+    if (index["width"], index["height"]) != (width, height):
+        return "built at {}x{}, the viewer needs {}x{}".format(index["width"], index["height"], width, height)
+    if index.get("sources") != source_stamps(cameraPaths + semanticPaths):
+        return "the source streams changed since it was built"
+    return None
+
+
+def has_cache(cacheDir, cameraPaths, semanticPaths, width, height):
+    if not os.path.exists(os.path.join(cacheDir, indexName)):
+        return False
+    reason = stale_reason(cacheDir, cameraPaths, semanticPaths, width, height)
+    if reason is not None:
+        print("Ignoring the frame cache in {} : {}, rebuild it with `python frame_cache.py`".format(cacheDir, reason))
+    return reason is None
+
+
+class FrameCache:
+    # serves (4, H, W, 4) uint8 camera and (4, H, W) int32 semantic arrays as read-only views of the mmapped files,
+    # setRamImage copies them into the textures
+    def __init__(self, cacheDir):
+        with open(os.path.join(cacheDir, indexName)) as f:
+            index = json.load(f)
+        self.width = index["width"]
+        self.height = index["height"]
+        self.numFrames = index["numFrames"]
+        self.cameras = np.load(os.path.join(cacheDir, "cameras.npy"), mmap_mode="r")
+        self.semantics = np.load(os.path.join(cacheDir, "semantics.npy"), mmap_mode="r")
+
+    def get(self, idx):
+        idx = idx % self.numFrames
+        return self.cameras[idx], self.semantics[idx]
+
+
+if __name__ == "__main__":
+    import SVM_RealImgs
+
+    parser = argparse.ArgumentParser(description="Preprocess the SVM_RealImgs replay streams into an mmap cache")
+    parser.add_argument("--output", default=SVM_RealImgs.cache_dir)
+    parser.add_argument("--frames", type=int, default=None, help="number of frames (default: all)")
+    args = parser.parse_args()
+
+    build_cache(
+        args.output,
+        SVM_RealImgs.camera_paths,
+        SVM_RealImgs.semantic_paths,
+        SVM_RealImgs.img_width,
+        SVM_RealImgs.img_height,
+        args.frames,
+    )
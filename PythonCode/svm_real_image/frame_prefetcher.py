@@ -0,0 +1,139 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+from label_pack import open_replay
+
+
+def prepareCamera(frame, width, height, dst=None):
+    # decoded BGR frame -> (H, W, 4) BGRA uint8 as uploaded to planeTexArray
+    frame = cv.resize(frame, (width, height))
+    return cv.cvtColor(frame, cv.COLOR_BGR2BGRA, dst=dst)
+
+
+def prepareSemantic(frame, width, height):
+    # decoded semantic frame (BGR video frame or (H, W) label pack frame) -> (H, W) uint8 class ids
+    frame = cv.resize(frame, (width, height), interpolation=cv.INTER_NEAREST)
+    if frame.ndim == 3:
+        frame = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    return frame
+
+
+class FramePrefetcher:
+    # Background loader for the real-image SVM.
+    # The four camera and four semantic streams are decoded, resized and color-converted in parallel worker threads
+    # (OpenCV releases the GIL) straight into a ring of preallocated (4, H, W, 4) uint8 / (4, H, W) int32 slots,
+    # up to `lookahead` frames ahead of the viewer.
+    # With dropIfBehind the viewer never waits: get() returns None when no frame is ready and the previous textures
+    # stay on screen, and when several frames are ready it skips to the newest one (the older slots go back to the
+    # decoder). Otherwise get() blocks until the next frame is decoded and shows every frame.
+    def __init__(self, cameraPaths, semanticPaths, width, height, lookahead=4, dropIfBehind=True):
+        self.cameraReplays = [open_replay([path]) for path in cameraPaths]
+        self.semanticReplays = [open_replay([path]) for path in semanticPaths]
+        self.numFrames = min(replay.numFrames for replay in self.cameraReplays + self.semanticReplays)
+        self.width = width
+        self.height = height
+        self.dropIfBehind = dropIfBehind
+
+        numCams = len(cameraPaths)
+        # ready frames + the one being filled + the one held by the viewer
+        numSlots = lookahead + 2
+        self.cameraSlots = np.zeros((numSlots, numCams, height, width, 4), dtype=np.uint8)
+        self.semanticSlots = np.zeros((numSlots, numCams, height, width), dtype=np.int32)
+
+        self.freeSlots = queue.Queue()
+        for slot in range(numSlots):
+            self.freeSlots.put(slot)
+        self.readySlots = queue.Queue(maxsize=lookahead)
+        self.heldSlot = None
+
+        self.pool = ThreadPoolExecutor(max_workers=numCams * 2)
+        self.running = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+        self.framesDecoded = 0
+        self.framesShown = 0
+        self.framesMissed = 0
+        self.framesSkipped = 0
+
+    def _loadCamera(self, cam, slot):
+        frame = self.cameraReplays[cam].read()[0]
+        prepareCamera(frame, self.width, self.height, dst=self.cameraSlots[slot, cam])
+
+    def _loadSemantic(self, cam, slot):
+        frame = self.semanticReplays[cam].read()[0]
+        self.semanticSlots[slot, cam] = prepareSemantic(frame, self.width, self.height)
+
+    def _run(self):
+        frameIdx = 0
+        while self.running:
+            try:
+                slot = self.freeSlots.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            jobs = []
+            for cam in range(len(self.cameraReplays)):
+                jobs.append(self.pool.submit(self._loadCamera, cam, slot))
+                jobs.append(self.pool.submit(self._loadSemantic, cam, slot))
+            for job in jobs:
+                job.result()
+            self.readySlots.put((frameIdx, slot))
+            self.framesDecoded += 1
+            frameIdx = (frameIdx + 1) % self.numFrames
+            if frameIdx == 0:
+                # every stream wraps together at the shortest one, longer streams would drift out of sync otherwise
+                for replay in self.cameraReplays + self.semanticReplays:
+                    replay.seek(0)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        # unblock the loader if it waits for a ready slot
+        while not self.readySlots.empty():
+            self.freeSlots.put(self.readySlots.get()[1])
+        self.thread.join(timeout=1)
+        self.pool.shutdown(wait=True)
+        for replay in self.cameraReplays + self.semanticReplays:
+            replay.release()
+
+    def get(self):
+        # returns (frameIdx, cameraArray, semanticArray), the arrays stay valid until the next get()
+        try:
+            frameIdx, slot = self.readySlots.get(block=not self.dropIfBehind)
+        except queue.Empty:
+            self.framesMissed += 1
+            return None
+
+        if self.dropIfBehind:
+            # the viewer is behind the decoder, show the newest ready frame
+            while True:
+                try:
+                    newer = self.readySlots.get_nowait()
+                except queue.Empty:
+                    break
+                self.freeSlots.put(slot)
+                self.framesSkipped += 1
+                frameIdx, slot = newer
+
+        if self.heldSlot is not None:
+            self.freeSlots.put(self.heldSlot)
+        self.heldSlot = slot
+        self.framesShown += 1
+        return frameIdx, self.cameraSlots[slot], self.semanticSlots[slot]
+
+    def stats(self):
+        return {
+            "decoded": self.framesDecoded,
+            "shown": self.framesShown,
+            "missed": self.framesMissed,
+            "skipped": self.framesSkipped,
+            "ready": self.readySlots.qsize(),
+            "decodeFps": [replay.decodeFps()[0] for replay in self.cameraReplays + self.semanticReplays],
+        }
@@ -38,6 +38,10 @@ uniform float fy_;
 uniform float cx_;
 uniform float cy_;
 
+uniform sampler2DArray uvLuts;
+uniform float uvLutScale = 2.0;
+uniform int useUvLut = 0;
+
 uniform int debug_mode;
 
 
@@ -69,6 +73,15 @@ vec2 distortPoint(vec2 Array_uv)
     return uv_out;//vec2(Array_uv.x / img_width_, Array_uv.y / img_height_);
 }
 
+// distortPoint() baked per camera by fisheye_lut.py, indexed by the compressed pinhole NDC
+vec2 lookupUv(vec2 texPos, int camId)
+{
+    if (useUvLut == 0) return distortPoint(texPos);
+    vec2 ndc = texPos * 2.0 - 1.0;
+    vec2 t = ndc / (uvLutScale + abs(ndc));
+    return texture(uvLuts, vec3(t * 0.5 + 0.5, camId)).xy;
+}
+
 vec4 blendArea(int camId0, int camId1, vec3 pos, vec3 pos_original, mat4 viewProjs[4], int caseId, float weightId0, int debugMode) {
     const float bias0 = weightId0;//1.0;
     const float bias1 = 1.0 - weightId0;//1.0;
@@ -127,8 +140,8 @@ vec4 blendArea(int camId0, int camId1, vec3 pos, vec3 pos_original, mat4 viewPro
         imagePos2D = imagePos.xy / imagePos.w;
         texPos1 = (imagePos2D + vec2(1.0, 1.0)) * 0.5;
         
-        texPos0 = distortPoint(texPos0);
-        texPos1 = distortPoint(texPos1);
+        texPos0 = lookupUv(texPos0, camId0);
+        texPos1 = lookupUv(texPos1, camId1);
 
         //texPos0 = texPos0_;
         //texPos1 = texPos1_;
@@ -232,7 +245,7 @@ void main()
                 if (imagePos.w <= 0.001) imagePos.w = 0.001;
                 vec2 imagePos2D = imagePos.xy / imagePos.w;
                 vec2 texPos0 = (imagePos2D + vec2(1.0, 1.0)) * 0.5;
-                texPos0 = distortPoint(texPos0);
+                texPos0 = lookupUv(texPos0, camId);
 
                 ivec2 texIdx2d0 = ivec2((texPos0.x) * img_width_ + 0.5, (1 - texPos0.y) * img_height_ + 0.5);
                 int semantic0 = texelFetch(semanticImgs, ivec3(texIdx2d0, camId0), 0).r;
@@ -302,7 +315,7 @@ void main()
                 if (imagePos.w <= 0.001) imagePos.w = 0.001;
                 vec2 imagePos2D = imagePos.xy / imagePos.w;
                 vec2 texPos0 = (imagePos2D + vec2(1.0, 1.0)) * 0.5;
-                texPos0 = distortPoint(texPos0);
+                texPos0 = lookupUv(texPos0, camId);
                 colorOut = texture(cameraImgs, vec3(texPos0.x, (1 - texPos0.y), camId));
                 break;
             }
@@ -41,6 +41,10 @@ uniform float fy_ = 346.09009197978003;
 uniform float cx_ = 959.5;// - img_width_ / 2;
 uniform float cy_ = 539.5;// - img_height_ / 2;
 
+uniform sampler2DArray uvLuts;
+uniform float uvLutScale = 2.0;
+uniform int useUvLut = 0;
+
 vec2 distortPoint(vec2 Array_uv)
 {
         float position_x = Array_uv.x * img_width_;
@@ -69,6 +73,15 @@ vec2 distortPoint(vec2 Array_uv)
         return vec2(Array_uv.x / img_width_, Array_uv.y / img_height_);
 }
 
+// distortPoint() baked per camera by fisheye_lut.py, indexed by the compressed pinhole NDC
+vec2 lookupUv(vec2 texPos, int camId)
+{
+    if (useUvLut == 0) return distortPoint(texPos);
+    vec2 ndc = texPos * 2.0 - 1.0;
+    vec2 t = ndc / (uvLutScale + abs(ndc));
+    return texture(uvLuts, vec3(t * 0.5 + 0.5, camId)).xy;
+}
+
 void main() {
     vec3 pos = worldcoord;
     mat4 viewProjs[4] = {matViewProj0, matViewProj1, matViewProj2, matViewProj3};
@@ -81,7 +94,7 @@ void main() {
         if (imagePos.w <= 0.001) imagePos.w = 0.001;
         vec3 imagePos3 = imagePos.xyz / imagePos.w;
         vec2 texPos = (imagePos3.xy + vec2(1.0, 1.0)) * 0.5;
-        texPos = distortPoint(texPos);
+        texPos = lookupUv(texPos, i);
         if (imagePos3.z >= 0.0 && imagePos3.z <= 1.0
             && texPos.x >= 0.0 && texPos.x <= 1.0
             && texPos.y >= 0.0 && texPos.y <= 1.0) {
@@ -0,0 +1,181 @@
+import argparse
+import glob
+import os
+import struct
+import time
+
+import cv2 as cv
+import numpy as np
+
+from video_replay import VideoReplay
+
+# Lossless container for semantic label sequences (.rle).
+# header   : magic, width, height, numFrames
+# index    : numFrames + 1 uint64 byte offsets of the frames (O(1) seek)
+# frame    : numRuns uint32, run values uint8[numRuns], run lengths uint16[numRuns]
+# Runs are taken over the row-major (H, W) uint8 class ids (runs longer than 65535 are split),
+# decoding is a single np.repeat.
+
+magic = b"SVMLBL1\0"
+headerFormat = "<8sIII"
+headerSize = struct.calcsize(headerFormat)
+
+
+def encode_labels(labels):
+    flat = labels.ravel()
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    lengths = np.diff(np.append(starts, flat.size))
+    values = flat[starts].astype(np.uint8)
+
+    maxRun = np.iinfo(np.uint16).max
+    pieces = (lengths - 1) // maxRun + 1
+    values = np.repeat(values, pieces)
+    runs = np.full(len(values), maxRun, dtype=np.uint16)
+    runs[np.cumsum(pieces) - 1] = lengths - (pieces - 1) * maxRun
+    return struct.pack("<I", len(values)) + values.tobytes() + runs.tobytes()
+
+
+def decode_labels(payload, width, height, out=None):
+    numRuns = struct.unpack_from("<I", payload, 0)[0]
+    values = np.frombuffer(payload, np.uint8, numRuns, 4)
+    lengths = np.frombuffer(payload, np.uint16, numRuns, 4 + numRuns)
+    labels = np.repeat(values, lengths).reshape(height, width)
+    if out is None:
+        return labels
+    out[...] = labels
+    return out
+
+
+def write_label_pack(path, frames):
+    # frames : iterable of (H, W) uint8 labels of identical size
+    offsets = []
+    payloads = []
+    offset = 0
+    width = height = 0
+    for labels in frames:
+        height, width = labels.shape
+        payload = encode_labels(labels)
+        offsets.append(offset)
+        payloads.append(payload)
+        offset += len(payload)
+    offsets.append(offset)
+
+    dataStart = headerSize + 8 * len(offsets)
+    with open(path, "wb") as f:
+        f.write(struct.pack(headerFormat, magic, width, height, len(payloads)))
+        f.write((np.array(offsets, dtype=np.uint64) + dataStart).tobytes())
+        for payload in payloads:
+            f.write(payload)
+
+
+class LabelPack:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        fileMagic, self.width, self.height, self.numFrames = struct.unpack_from(headerFormat, self.data, 0)
+        if fileMagic != magic:
+            raise IOError("{} is not a label pack".format(path))
+        self.offsets = np.frombuffer(self.data, np.uint64, self.numFrames + 1, headerSize)
+
+    def frame(self, idx, out=None):
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return decode_labels(memoryview(self.data)[start:end], self.width, self.height, out)
+
+
+class LabelReplay:
+    # VideoReplay counterpart for label packs, read() returns one (H, W) uint8 frame per stream
+    def __init__(self, paths):
+        self.paths = paths
+        self.packs = [LabelPack(path) for path in paths]
+        self.numFrames = min(pack.numFrames for pack in self.packs)
+        self.position = 0
+
+        self.decodeTime = [0.0] * len(self.packs)
+        self.decodedFrames = [0] * len(self.packs)
+        self.seeks = 0
+
+    def seek(self, idx):
+        self.position = idx
+        self.seeks += 1
+
+    def read(self):
+        if self.position >= self.numFrames:
+            self.seek(0)
+
+        frames = []
+        for i, pack in enumerate(self.packs):
+            t_start = time.perf_counter()
+            frames.append(pack.frame(self.position))
+            self.decodeTime[i] += time.perf_counter() - t_start
+            self.decodedFrames[i] += 1
+
+        self.position += 1
+        return frames
+
+    def decodeFps(self):
+        return [n / t if t > 0 else 0.0 for n, t in zip(self.decodedFrames, self.decodeTime)]
+
+    def release(self):
+        self.packs = []
+
+
+def open_replay(paths):
+    if all(path.endswith(".rle") for path in paths):
+        return LabelReplay(paths)
+    return VideoReplay(paths)
+
+
+def semantic_path(base_path, position):
+    # prefer the lossless label pack over the lossy webm stream
+    path = os.path.join(base_path, "semantic_" + position + ".rle")
+    if os.path.exists(path):
+        return path
+    return os.path.join(base_path, "semantic_" + position + ".webm")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack label PNG sequences into lossless .rle streams")
+    parser.add_argument("--image-folder", default="./src/RM_data3/labels")
+    parser.add_argument("--output", default="./src/RM_data3")
+    parser.add_argument("--benchmark", action="store_true", help="compare decoding against the webm streams")
+    args = parser.parse_args()
+
+    camera_types = ["front", "left", "right", "rear"]
+
+    for camera_type in camera_types:
+        pngs = sorted(glob.glob(os.path.join(args.image_folder, camera_type + "_*.png")))
+        if not pngs:
+            continue
+        path = os.path.join(args.output, "semantic_" + camera_type + ".rle")
+        write_label_pack(path, (cv.imread(png, cv.IMREAD_GRAYSCALE) for png in pngs))
+        print("{} : {} frames, {:.1f} KB".format(path, len(pngs), os.path.getsize(path) / 1024))
+
+    if args.benchmark:
+        print("| stream | webm ms/frame | rle ms/frame | webm wrong px | rle wrong px |")
+        print("|--------|---------------|--------------|---------------|--------------|")
+        for camera_type in camera_types:
+            pngs = sorted(glob.glob(os.path.join(args.image_folder, camera_type + "_*.png")))
+            webm = VideoReplay([os.path.join(args.output, "semantic_" + camera_type + ".webm")])
+            rle = LabelReplay([os.path.join(args.output, "semantic_" + camera_type + ".rle")])
+            numFrames = min(len(pngs), webm.numFrames, rle.numFrames)
+
+            webmTime = rleTime = 0.0
+            webmWrong = rleWrong = 0
+            for png in pngs[:numFrames]:
+                reference = cv.imread(png, cv.IMREAD_GRAYSCALE)
+
+                t_start = time.perf_counter()
+                labels = cv.cvtColor(webm.read()[0], cv.COLOR_BGR2GRAY)
+                webmTime += time.perf_counter() - t_start
+                webmWrong += np.count_nonzero(labels != reference)
+
+                t_start = time.perf_counter()
+                labels = rle.read()[0]
+                rleTime += time.perf_counter() - t_start
+                rleWrong += np.count_nonzero(labels != reference)
+
+            print(
+                "| {} | {:.2f} | {:.2f} | {} | {} |".format(
+                    camera_type, webmTime / numFrames * 1000, rleTime / numFrames * 1000, webmWrong, rleWrong
+                )
+            )
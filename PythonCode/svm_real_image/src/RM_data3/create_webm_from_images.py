@@ -1,33 +1,83 @@
+import argparse
+import glob
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import imageio.v2 as imageio
 
 
-def create_webm_from_images(image_folder, camera_type, output_filename):
-    images = []
+def find_frame_range(image_folder, camera_type):
+    numbers = [
+        int(os.path.splitext(os.path.basename(path))[0][len(camera_type) + 1 :])
+        for path in glob.glob(os.path.join(image_folder, f"{camera_type}_*.png"))
+    ]
+    if not numbers:
+        return 0, 0
+    return min(numbers), max(numbers) + 1
+
+
+def create_webm_from_images(image_folder, camera_type, output_filename, start=None, end=None, fps=20):
+    # frames are read and encoded one at a time, memory use does not grow with the sequence length
     print(f"Processing images for {camera_type}...")
+    # the missing bounds come from the frame numbers on disk, sequences do not have to start at 0
+    if start is None or end is None:
+        first, last = find_frame_range(image_folder, camera_type)
+        start = first if start is None else start
+        end = last if end is None else end
 
-    for file_number in range(1401):
+    writer = None
+    num_frames = 0
+    t_start = time.perf_counter()
+    for file_number in range(start, end):
         filename = f"{camera_type}_{file_number:06d}.png"
         file_path = os.path.join(image_folder, filename)
-        if os.path.exists(file_path):
-            images.append(imageio.imread(file_path))
-        else:
+        if not os.path.exists(file_path):
             print(f"File not found: {file_path}")
+            continue
+        if writer is None:
+            print(f"Creating {output_filename}...")
+            writer = imageio.get_writer(output_filename, fps=fps, codec="libvpx")
+        writer.append_data(imageio.imread(file_path))
+        num_frames += 1
 
-    if images:
-        print(f"Creating {output_filename}...")
-        writer = imageio.get_writer(output_filename, fps=20, codec="libvpx")
-        for img in images:
-            writer.append_data(img)
-        writer.close()
-        print(f"{output_filename} created successfully.")
-    else:
+    if writer is None:
         print(f"No images found for {camera_type}.")
+        return camera_type, 0, 0.0
+
+    writer.close()
+    elapsed = time.perf_counter() - t_start
+    print(f"{output_filename} created successfully.")
+    return camera_type, num_frames, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encode label PNG sequences into per-camera webm streams")
+    parser.add_argument("--image-folder", default="./labels")
+    parser.add_argument("--start", type=int, default=None, help="first frame number, default: the lowest one")
+    parser.add_argument("--end", type=int, default=None, help="last frame number (exclusive), default: all frames")
+    parser.add_argument("--fps", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
 
+    camera_types = ["front", "left", "right", "rear"]
 
-image_folder = "./labels"
-camera_types = ["front", "left", "right", "rear"]
+    # one process per camera type, each stream is encoded independently
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        jobs = [
+            pool.submit(
+                create_webm_from_images,
+                args.image_folder,
+                camera_type,
+                f"semantic_{camera_type}.webm",
+                args.start,
+                args.end,
+                args.fps,
+            )
+            for camera_type in camera_types
+        ]
+        results = [job.result() for job in jobs]
 
-for camera_type in camera_types:
-    output_filename = f"semantic_{camera_type}.webm"
-    create_webm_from_images(image_folder, camera_type, output_filename)
+    for camera_type, num_frames, elapsed in results:
+        fps = num_frames / elapsed if elapsed > 0 else 0.0
+        print(f"{camera_type} : {num_frames} frames in {elapsed:.1f} s ({fps:.1f} fps)")
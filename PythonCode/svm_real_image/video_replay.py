@@ -0,0 +1,49 @@
+import time
+
+import cv2 as cv
+
+
+class VideoReplay:
+    # Frame-synchronized sequential reader over several video streams.
+    # Frames are read in order, the streams are only seeked on an explicit seek() or when the replay loops,
+    # so VP8/VP9 streams are not re-decoded from the previous keyframe on every frame.
+    def __init__(self, paths):
+        self.paths = paths
+        self.caps = [cv.VideoCapture(path) for path in paths]
+        self.numFrames = min(int(cap.get(cv.CAP_PROP_FRAME_COUNT)) for cap in self.caps)
+        self.position = 0
+
+        self.decodeTime = [0.0] * len(self.caps)
+        self.decodedFrames = [0] * len(self.caps)
+        self.seeks = 0
+
+    def seek(self, idx):
+        for cap in self.caps:
+            cap.set(cv.CAP_PROP_POS_FRAMES, idx)
+        self.position = idx
+        self.seeks += 1
+
+    def read(self):
+        # returns one frame per stream and advances, loops back to the first frame at the end
+        if self.position >= self.numFrames:
+            self.seek(0)
+
+        frames = []
+        for i, cap in enumerate(self.caps):
+            t_start = time.perf_counter()
+            ok, frame = cap.read()
+            self.decodeTime[i] += time.perf_counter() - t_start
+            if not ok:
+                raise IOError("Failed to read frame {} of {}".format(self.position, self.paths[i]))
+            self.decodedFrames[i] += 1
+            frames.append(frame)
+
+        self.position += 1
+        return frames
+
+    def decodeFps(self):
+        return [n / t if t > 0 else 0.0 for n, t in zip(self.decodedFrames, self.decodeTime)]
+
+    def release(self):
+        for cap in self.caps:
+            cap.release()